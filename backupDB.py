@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+'''
+backupDB.py
+
+Takes an online backup of the task database with the sqlite3 backup API.
+The service can keep running - pages are copied a few at a time, so
+requests are not blocked while the backup runs.  Backups are gzip
+compressed and only the newest few are kept.  Like sendReport.py, normal
+output is suppressed when stdout is not a tty.
+
+    backupDB.py [--out DIR] [--no-compress] [--keep N] [--db PATH | --worker ID ... | --team]
+'''
+
+from simpleWorkReporter import defs
+from simpleWorkReporter import backup
+from simpleWorkReporter import team
+
+from simpleWorkReporter.errors import *
+from simpleWorkReporter.tasks import TaskDatabase
+
+from pathlib import Path
+import argparse
+import sys
+
+appname = defs.PACKAGE_NAME
+
+def ttyout(msg: str = ''):
+    ''' Wrapper for print to only stdout if stdout is tty '''
+    if sys.stdout.isatty():
+        print(msg)
+
+def errout(msg: str):
+    ''' Wrapper for printing to stderr for error messages regardless of tty '''
+    print(msg,file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Online task database backup')
+    parser.add_argument('--out', metavar='DIR',
+                        help=f'backup directory (default {defs.BACKUP_DIR}, '
+                             f'team workers use team/<worker_id>/backups)')
+    parser.add_argument('--no-compress', action='store_true', help='write a plain .db file')
+    parser.add_argument('--keep', type=int,
+                        default=int(defs.OPTIONAL_CONF_VALUES['Backup_Keep']['default']),
+                        help='newest backups kept per database, 0 keeps all (default %(default)s)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--db', help=f'task database path (default {defs.TASKDB_FILE_PATH})')
+    target.add_argument('--worker', metavar='ID', action='append', help='team mode worker (repeatable)')
+    target.add_argument('--team', action='store_true', help='every team mode worker')
+    args = parser.parse_args()
+
+    try:
+        if args.worker or args.team:
+            registry = team.WorkerRegistry()
+            worker_ids = args.worker or team.list_workers()
+            targets = []
+            for worker_id in worker_ids:
+                worker = registry.get(worker_id)
+                out_dir = Path(args.out) / worker_id if args.out else worker.worker_dir / 'backups'
+                targets.append((worker.task_db, out_dir))
+        else:
+            targets = [(TaskDatabase(db_path=args.db), args.out)]
+    except (swrConfigError, swrDatabaseError) as e:
+        errout(f'{appname}: {e}')
+        exit(1)
+
+    failed = 0
+    for task_db, out_dir in targets:
+        try:
+            path = backup.backup_database(
+                task_db, out_dir, compress=not args.no_compress, keep=args.keep
+            )
+        except (swrDatabaseError, OSError) as e:
+            failed += 1
+            errout(f'{appname}: {e}')
+            continue
+        ttyout(f'{task_db.db_path} -> {path} ({path.stat().st_size} bytes)')
+    exit(1 if failed else 0)
@@ -1,70 +1,239 @@
 #!/usr/bin/python3
-import socket
-import threading
-
-class DummySMTPServer:
-    def __init__(self, host='127.0.0.1', port=25):
-        self.host = host
-        self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-    def handle_client(self, client_socket, address):
-        print(f"Connection from {address}")
-        
-        # Send greeting
-        client_socket.send(b"220 localhost SMTP Ready\r\n")
-        
+'''
+dummy_smtp_server.py
+
+Local SMTP sink for exercising the mailer offline.  Speaks enough of
+RFC 5321 for smtplib (EHLO/HELO, MAIL, RCPT, DATA with dot-unstuffing,
+RSET, NOOP, QUIT), records accepted messages in memory or as .eml files,
+and prints messages per second and bytes received.
+
+Faults can be injected to test retry and error handling:
+    --latency MS         delay every reply (plus --jitter MS of random extra)
+    --fail-rate P        answer a fraction P of transactions with --fail-code
+                         at the --fail-at stage (mail, rcpt or data)
+    --disconnect-rate P  drop a fraction P of connections part way through DATA
+
+    sudo python3 devel/dummy_smtp_server.py [--port 25] [--store dir --out-dir /tmp/swr-mail]
+'''
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from pathlib import Path
+
+_REPLIES = {
+    221: 'Bye',
+    250: 'OK',
+    354: 'Start mail input; end with <CRLF>.<CRLF>',
+    421: 'Service not available, closing transmission channel',
+    451: 'Requested action aborted: local error in processing',
+    452: 'Requested action not taken: insufficient system storage',
+    500: 'Syntax error, command unrecognized',
+    501: 'Syntax error in parameters or arguments',
+    503: 'Bad sequence of commands',
+    550: 'Requested action not taken: mailbox unavailable',
+    552: 'Requested mail action aborted: exceeded storage allocation',
+    554: 'Transaction failed',
+}
+
+
+class SinkStats():
+    def __init__(self):
+        self.connections = 0
+        self.messages = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.disconnects = 0
+        self._last = (time.monotonic(), 0, 0)
+
+    def interval(self) -> str:
+        now = time.monotonic()
+        last_time, last_messages, last_bytes = self._last
+        elapsed = max(now - last_time, 1e-9)
+        rate = (self.messages - last_messages) / elapsed
+        byte_rate = (self.bytes - last_bytes) / elapsed
+        self._last = (now, self.messages, self.bytes)
+        return (
+            f'{rate:7.1f} msg/s {byte_rate / 1e6:7.2f} MB/s | total {self.messages} msgs '
+            f'{self.bytes / 1e6:.2f} MB, {self.connections} conns, '
+            f'{self.rejected} rejected, {self.disconnects} dropped'
+        )
+
+
+class DummySMTPServer():
+    def __init__(self, args):
+        self.args = args
+        self.stats = SinkStats()
+        self.random = random.Random(args.seed)
+        self.messages = deque(maxlen=args.keep)  # --store memory
+        if args.store == 'dir':
+            os.makedirs(args.out_dir, exist_ok=True)
+
+    async def reply(self, writer: asyncio.StreamWriter, code: int, text: str = None):
+        if self.args.latency or self.args.jitter:
+            delay = self.args.latency + self.random.uniform(0, self.args.jitter)
+            await asyncio.sleep(delay / 1000)
+        writer.write(f'{code} {text or _REPLIES[code]}\r\n'.encode())
+        await writer.drain()
+
+    def inject_failure(self, stage: str) -> bool:
+        if self.args.fail_at == stage and self.random.random() < self.args.fail_rate:
+            self.stats.rejected += 1
+            return True
+        return False
+
+    def store(self, sender: str, recipients: list, data: bytes):
+        self.stats.messages += 1
+        self.stats.bytes += len(data)
+        if self.args.store == 'memory':
+            self.messages.append((sender, recipients, data))
+        elif self.args.store == 'dir':
+            path = Path(self.args.out_dir) / f'{time.time():.6f}-{self.stats.messages}.eml'
+            path.write_bytes(data)
+        if self.args.verbose:
+            print(f'Accepted message {self.stats.messages}: {len(data)} bytes '
+                  f'from {sender} to {", ".join(recipients)}')
+
+    async def read_data(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        ''' Message body up to the lone "." line, dot-unstuffed.  None if dropped '''
+        drop_after = None
+        if self.random.random() < self.args.disconnect_rate:
+            drop_after = self.random.randint(0, 20)
+        lines = []
         while True:
-            try:
-                data = client_socket.recv(1024).decode('utf-8').strip()
-                if not data:
+            line = await reader.readline()
+            if not line:
+                return None
+            if line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            if line.startswith(b'.'):
+                line = line[1:]
+            lines.append(line)
+            if drop_after is not None and len(lines) > drop_after:
+                self.stats.disconnects += 1
+                writer.close()
+                return None
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connections += 1
+        if self.args.verbose:
+            print(f'Connection from {writer.get_extra_info("peername")}')
+        sender, recipients, greeted = None, [], False
+        try:
+            await self.reply(writer, 220, 'localhost dummy SMTP sink ready')
+            while True:
+                line = await reader.readline()
+                if not line:
                     break
-                
-                print(f"Received: {data}")
-                
-                if data.upper().startswith('HELO') or data.upper().startswith('EHLO'):
-                    client_socket.send(b"250 localhost\r\n")
-                elif data.upper().startswith('MAIL FROM:'):
-                    client_socket.send(b"250 OK\r\n")
-                elif data.upper().startswith('RCPT TO:'):
-                    client_socket.send(b"250 OK\r\n")
-                elif data.upper() == 'DATA':
-                    client_socket.send(b"354 Start mail input; end with <CRLF>.<CRLF>\r\n")
-                elif data == '.':
-                    client_socket.send(b"250 OK: Message accepted\r\n")
-                elif data.upper() == 'QUIT':
-                    client_socket.send(b"221 Bye\r\n")
+                command, _sep, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+                command = command.upper()
+                if command == 'EHLO':
+                    greeted = True
+                    sender, recipients = None, []
+                    writer.write(b'250-localhost\r\n250-8BITMIME\r\n250-PIPELINING\r\n')
+                    await self.reply(writer, 250, f'SIZE {self.args.max_size}')
+                elif command == 'HELO':
+                    greeted = True
+                    sender, recipients = None, []
+                    await self.reply(writer, 250, 'localhost')
+                elif command == 'MAIL':
+                    if not greeted or sender is not None:
+                        await self.reply(writer, 503)
+                    elif not argument.upper().startswith('FROM:'):
+                        await self.reply(writer, 501)
+                    elif self.inject_failure('mail'):
+                        await self.reply(writer, self.args.fail_code)
+                    else:
+                        sender = argument[5:].strip()
+                        await self.reply(writer, 250)
+                elif command == 'RCPT':
+                    if sender is None:
+                        await self.reply(writer, 503)
+                    elif not argument.upper().startswith('TO:'):
+                        await self.reply(writer, 501)
+                    elif self.inject_failure('rcpt'):
+                        await self.reply(writer, self.args.fail_code)
+                    else:
+                        recipients.append(argument[3:].strip())
+                        await self.reply(writer, 250)
+                elif command == 'DATA':
+                    if not recipients:
+                        await self.reply(writer, 503)
+                        continue
+                    await self.reply(writer, 354)
+                    data = await self.read_data(reader, writer)
+                    if data is None:
+                        break
+                    if len(data) > self.args.max_size:
+                        self.stats.rejected += 1
+                        await self.reply(writer, 552)
+                    elif self.inject_failure('data'):
+                        await self.reply(writer, self.args.fail_code)
+                    else:
+                        self.store(sender, recipients, data)
+                        await self.reply(writer, 250, 'OK: Message accepted')
+                    sender, recipients = None, []
+                elif command == 'RSET':
+                    sender, recipients = None, []
+                    await self.reply(writer, 250)
+                elif command == 'NOOP':
+                    await self.reply(writer, 250)
+                elif command == 'VRFY':
+                    await self.reply(writer, 252, 'Cannot VRFY user')
+                elif command == 'QUIT':
+                    await self.reply(writer, 221)
                     break
                 else:
-                    client_socket.send(b"250 OK\r\n")
-                    
-            except Exception as e:
-                print(f"Error: {e}")
-                break
-        
-        client_socket.close()
-        print(f"Connection closed: {address}")
-
-    def start(self):
-        self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
-        print(f"SMTP server listening on {self.host}:{self.port}")
-        
-        try:
-            while True:
-                client_socket, address = self.socket.accept()
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-        except KeyboardInterrupt:
-            print("Stopping SMTP server")
+                    await self.reply(writer, 500)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
         finally:
-            self.socket.close()
+            writer.close()
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(self.args.stats_interval)
+            print(self.stats.interval(), flush=True)
+
+    async def start(self):
+        server = await asyncio.start_server(
+            self.handle_client, self.args.host, self.args.port, limit=1024 * 1024
+        )
+        print(f'SMTP sink listening on {self.args.host}:{self.args.port} '
+              f'(store={self.args.store})', flush=True)
+        async with server:
+            if self.args.stats_interval:
+                asyncio.ensure_future(self.report_stats())
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25)
+    parser.add_argument('--store', choices=['none', 'memory', 'dir'], default='none')
+    parser.add_argument('--out-dir', default='smtp_sink', help='directory for --store dir')
+    parser.add_argument('--keep', type=int, default=1000, help='messages kept by --store memory')
+    parser.add_argument('--max-size', type=int, default=50 * 1024 * 1024)
+    parser.add_argument('--latency', type=float, default=0, help='ms added before every reply')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra ms per reply')
+    parser.add_argument('--fail-rate', type=float, default=0)
+    parser.add_argument('--fail-code', type=int, default=451, choices=sorted(c for c in _REPLIES if c >= 400))
+    parser.add_argument('--fail-at', choices=['mail', 'rcpt', 'data'], default='data')
+    parser.add_argument('--disconnect-rate', type=float, default=0)
+    parser.add_argument('--stats-interval', type=float, default=5, help='seconds, 0 to disable')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = DummySMTPServer(args)
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        print(f'Stopping SMTP sink - {server.stats.interval()}')
+
 
 if __name__ == '__main__':
-    server = DummySMTPServer(host='0.0.0.0')
-    server.start()
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+'''
+import_budget.py
+
+Startup import cost check for the entry points.  Each one is imported in a
+fresh interpreter with "python -X importtime" (best of --runs, so a busy
+machine doesn't fail the check) and compared against its budget, and the
+modules it must not pull in are checked - e.g. sendReport.py loading flask,
+or anything but setupService.py loading cryptography.
+
+    python3 devel/import_budget.py [--runs N] [--scale FACTOR]
+
+Exits 1 if any entry point is over budget or imports a forbidden module.
+Budgets are in milliseconds of cumulative import time on a typical
+developer machine, use --scale on slower hardware.
+'''
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+_HEADLESS_FORBIDDEN = ('flask', 'werkzeug', 'cryptography')
+
+# module -> (budget ms, modules it must not import)
+ENTRY_POINTS = {
+    'simpleWorkReporter': (20, _HEADLESS_FORBIDDEN + ('jinja2', 'sqlite3')),
+    'simpleWorkReporter.tasks': (120, _HEADLESS_FORBIDDEN + ('jinja2', 'smtplib')),
+    'simpleWorkReporter.config': (120, _HEADLESS_FORBIDDEN + ('jinja2', 'smtplib')),
+    'maintainDB': (150, _HEADLESS_FORBIDDEN + ('jinja2', 'smtplib')),
+    'backupDB': (150, _HEADLESS_FORBIDDEN + ('jinja2', 'smtplib')),
+    'sendReport': (250, _HEADLESS_FORBIDDEN),
+    'sendDigest': (250, _HEADLESS_FORBIDDEN),
+    'setupService': (250, ('flask', 'werkzeug')),
+    'startService': (500, ('cryptography',)),
+}
+
+
+def measure(module: str) -> tuple:
+    '''
+    (cumulative import time in ms, set of imported module names) for one
+    import of module in a fresh interpreter
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr}')
+    total, imported = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            total = int(cumulative) / 1000
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget')
+    args = parser.parse_args()
+
+    failed = 0
+    print(f'{"entry point":<28} {"best ms":>8} {"budget":>8}  result')
+    for module, (budget, forbidden) in ENTRY_POINTS.items():
+        budget *= args.scale
+        times, imported = [], set()
+        for _ in range(args.runs):
+            elapsed, imported = measure(module)
+            times.append(elapsed)
+        best = min(times)
+        problems = []
+        if best > budget:
+            problems.append('over budget')
+        found = sorted(
+            name for name in forbidden
+            if any(i == name or i.startswith(f'{name}.') for i in imported)
+        )
+        if found:
+            problems.append('imports ' + ', '.join(found))
+        failed += bool(problems)
+        print(f'{module:<28} {best:>8.1f} {budget:>8.0f}  {"; ".join(problems) or "ok"}')
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
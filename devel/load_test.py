@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+'''
+load_test.py
+
+HTTP load generator for a running simpleWorkReporter instance.  Each client
+logs in with its own session cookie, then requests a weighted random mix of
+endpoints until the run time is up.  Throughput and p50/p95/p99 latency are
+reported per endpoint.
+
+Point the service's SMTP server at a local sink (devel/dummy_smtp_server.py)
+before including "confirm" in the mix - every confirm sends a real report.
+
+    python3 devel/load_test.py [--url URL] [-c CLIENTS] [-d SECONDS]
+                               [--mix index=50,alltasks=15,submit=25,send=8,confirm=2]
+
+Redirects are not followed, so each sample is the cost of one request.
+The service's slow query log (Slow_Query_Ms, on by default) times every
+task DB statement and logs the load test's requests with the real ones -
+set Slow_Query_Ms = 0 in worker.conf for numbers comparable between runs.
+'''
+import argparse
+import getpass
+import http.cookiejar
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from simpleWorkReporter import defs
+from simpleWorkReporter.config import LoadSwrSettings
+from simpleWorkReporter.errors import swrConfigError
+
+# name -> (method, path, form data or None)
+ENDPOINTS = {
+    'index': ('GET', '/', None),
+    'alltasks': ('GET', '/alltasks', None),
+    'submit': ('POST', '/submit/task', {
+        'newTask': 'newTask', 'taskType': 'LoadTest',
+        'taskSubType': '0', 'description': 'load_test.py generated task',
+    }),
+    'send': ('GET', '/send', None),
+    'confirm': ('POST', '/send/confirm', {'confirm': 'confirm'}),
+}
+DEFAULT_MIX = 'index=50,alltasks=15,submit=25,send=8,confirm=2'
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        name, _sep, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(
+                f'unknown endpoint "{name}", choose from {", ".join(ENDPOINTS)}'
+            )
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def default_url() -> str:
+    ''' Local service URL from worker.conf, https when the service has its cert files '''
+    port = 5000
+    try:
+        port = LoadSwrSettings(defs.CONFIG_FILE_PATH).service_port
+    except (swrConfigError, OSError) as e:
+        print(f'Using port {port}, worker.conf not loaded: {e}', file=sys.stderr)
+    # Same test the service uses to decide whether to serve over SSL
+    use_ssl = os.path.isfile(defs.SSL_CERT_FILE) and os.path.isfile(defs.SSL_KEY_FILE)
+    return f'{"https" if use_ssl else "http"}://127.0.0.1:{port}'
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    ''' Nearest-rank percentile of an already sorted list '''
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Client(threading.Thread):
+    def __init__(self, number: int, args, deadline: float, results: dict, lock: threading.Lock):
+        super().__init__(daemon=True)
+        self.number = number
+        self.args = args
+        self.deadline = deadline
+        self.results = results
+        self.lock = lock
+        self.random = random.Random(args.seed + number)
+        context = ssl.create_default_context()
+        if not args.verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            urllib.request.HTTPSHandler(context=context),
+            _NoRedirect(),
+        )
+        if args.compressed:
+            self.opener.addheaders = [('Accept-Encoding', 'gzip, deflate, br')]
+
+    def request(self, method: str, path: str, form: dict = None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.args.url + path, data=data, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.args.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - start
+
+    def login(self) -> bool:
+        status, _elapsed = self.request('POST', '/login', {'password': self.args.password})
+        # A good login redirects to the index page, a bad one re-renders the form
+        return status == 302
+
+    def run(self):
+        if not self.login():
+            with self.lock:
+                self.results['_login_failures'] += 1
+            return
+        names = list(self.args.mix)
+        weights = [self.args.mix[name] for name in names]
+        while time.monotonic() < self.deadline:
+            name = self.random.choices(names, weights)[0]
+            method, path, form = ENDPOINTS[name]
+            status, elapsed = self.request(method, path, form)
+            with self.lock:
+                entry = self.results[name]
+                entry['timings'].append(elapsed)
+                entry['statuses'][status] += 1
+            if self.args.think:
+                time.sleep(self.random.expovariate(1 / self.args.think))
+
+
+def print_report(results: dict, duration: float):
+    print(f'{"endpoint":<10} {"requests":>9} {"req/s":>8} {"p50 ms":>8} '
+          f'{"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}  statuses')
+    every = []
+    for name in ENDPOINTS:
+        entry = results.get(name)
+        if not entry or not entry['timings']:
+            continue
+        timings = sorted(entry['timings'])
+        every.extend(timings)
+        statuses = ' '.join(f'{k}:{v}' for k, v in sorted(entry['statuses'].items(), key=str))
+        print(f'{name:<10} {len(timings):>9} {len(timings) / duration:>8.1f} '
+              f'{percentile(timings, 50) * 1000:>8.1f} {percentile(timings, 95) * 1000:>8.1f} '
+              f'{percentile(timings, 99) * 1000:>8.1f} {timings[-1] * 1000:>8.1f}  {statuses}')
+    every.sort()
+    if every:
+        print(f'{"total":<10} {len(every):>9} {len(every) / duration:>8.1f} '
+              f'{percentile(every, 50) * 1000:>8.1f} {percentile(every, 95) * 1000:>8.1f} '
+              f'{percentile(every, 99) * 1000:>8.1f} {every[-1] * 1000:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='service base URL (default: port from worker.conf)')
+    parser.add_argument('-c', '--clients', type=int, default=10)
+    parser.add_argument('-d', '--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'weighted endpoint mix (default {DEFAULT_MIX})')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean seconds of think time between a client\'s requests')
+    parser.add_argument('--password', default=os.environ.get('SWR_PASSWORD'),
+                        help='access password (default: $SWR_PASSWORD or prompt)')
+    parser.add_argument('--compressed', action='store_true', help='send Accept-Encoding like a browser')
+    parser.add_argument('--verify', action='store_true', help='verify the TLS certificate')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    args.url = (args.url or default_url()).rstrip('/')
+    if args.password is None:
+        args.password = getpass.getpass('Access password: ')
+
+    results = {name: {'timings': [], 'statuses': Counter()} for name in args.mix}
+    results['_login_failures'] = 0
+    lock = threading.Lock()
+    print(f'{args.clients} clients against {args.url} for {args.duration:g}s, '
+          f'mix {", ".join(f"{k}={v:g}" for k, v in args.mix.items())}')
+    start = time.monotonic()
+    deadline = start + args.duration
+    clients = [Client(n, args, deadline, results, lock) for n in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    duration = time.monotonic() - start
+
+    if results['_login_failures']:
+        print(f'WARNING: {results["_login_failures"]} clients failed to log in')
+    print_report(results, duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+'''
+storage_bench.py
+
+Task database throughput for each Storage_Profile, plus "rollback" (the
+SQLite defaults used before storage profiles: rollback journal,
+synchronous=FULL) for comparison.  Each profile gets a fresh database in
+--dir, which should be on the disk the service really uses - fsync is
+close to free on tmpfs and the profiles would all look alike.
+
+    python3 devel/storage_bench.py [--dir PATH] [--inserts N] [--reads N]
+                                   [--mixed SECONDS] [--readers N]
+
+Phases:
+    insert  add_task() calls, one commit each
+    read    get_task() of random ids
+    scan    get_unsent_tasks() of every inserted task
+    mixed   one add_task() writer against --readers get_task() threads,
+            the case where a rollback journal makes readers and the writer
+            wait for each other
+
+The slow query log is off for the run (--slow-query-ms to turn it on), so
+the numbers don't include its per-statement timing and the service's
+swr_slow_queries.log isn't filled with entries for the benchmark databases.
+'''
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from simpleWorkReporter import defs
+from simpleWorkReporter import querylog
+from simpleWorkReporter.tasks import TaskDatabase
+
+ROLLBACK_PROFILE = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+    'busy_timeout': 5000,
+}
+DESCRIPTION = 'benchmark task ' * 8
+DATE = time.strftime('%Y-%m-%d')
+
+
+def timed(count: int, action) -> float:
+    ''' Calls per second of action(i) for i in range(count) '''
+    start = time.perf_counter()
+    for i in range(count):
+        action(i)
+    return count / (time.perf_counter() - start)
+
+
+def mixed(task_db: TaskDatabase, task_count: int, seconds: float, readers: int) -> tuple:
+    ''' (writes/s, reads/s) with one writer and several readers running together '''
+    stop = threading.Event()
+    counts = [0] * (readers + 1)
+
+    def write():
+        while not stop.is_set():
+            task_db.add_task('SR', 'bench', DESCRIPTION, DATE)
+            counts[0] += 1
+
+    def read(slot):
+        rand = random.Random(slot)
+        while not stop.is_set():
+            task_db.get_task(rand.randint(1, task_count))
+            counts[slot] += 1
+
+    threads = [threading.Thread(target=write)]
+    threads += [threading.Thread(target=read, args=(i + 1,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts[0] / seconds, sum(counts[1:]) / seconds
+
+
+def bench_profile(name: str, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix=f'swr-bench-{name}-', dir=args.dir) as tmp_dir:
+        task_db = TaskDatabase(db_path=Path(tmp_dir) / 'tasks.db', storage_profile=name)
+        rand = random.Random(0)
+        results = {}
+        results['insert'] = timed(
+            args.inserts, lambda i: task_db.add_task('SR', 'bench', DESCRIPTION, DATE)
+        )
+        results['read'] = timed(
+            args.reads, lambda i: task_db.get_task(rand.randint(1, args.inserts))
+        )
+        results['scan'] = timed(5, lambda i: task_db.get_unsent_tasks())
+        results['mixed_writes'], results['mixed_reads'] = mixed(
+            task_db, args.inserts, args.mixed, args.readers
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=None, help='directory for the test databases (default: system temp)')
+    parser.add_argument('--inserts', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=5000)
+    parser.add_argument('--mixed', type=float, default=5, help='seconds for the mixed phase')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--profile', action='append', help='profiles to run (default: all)')
+    parser.add_argument('--slow-query-ms', type=float, default=0,
+                        help='slow query log threshold (default 0, log off)')
+    args = parser.parse_args()
+
+    querylog.set_threshold(args.slow_query_ms)
+
+    defs.TASKDB_STORAGE_PROFILES.setdefault('rollback', ROLLBACK_PROFILE)
+    profiles = args.profile or list(defs.TASKDB_STORAGE_PROFILES)
+
+    print(f'{"profile":<10} {"insert/s":>10} {"read/s":>10} {"scan/s":>8} '
+          f'{"mixed w/s":>10} {"mixed r/s":>10}')
+    for name in profiles:
+        r = bench_profile(name, args)
+        print(f'{name:<10} {r["insert"]:>10.0f} {r["read"]:>10.0f} {r["scan"]:>8.1f} '
+              f'{r["mixed_writes"]:>10.0f} {r["mixed_reads"]:>10.0f}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+'''
+tls_handshake_bench.py
+
+Compares key generation time and TLS handshake cost for the certificate key
+types offered by sslcert.create_ssl_files, using the same SSLContext the web
+service builds (sslcert.build_ssl_context).  Each key type is measured for
+full handshakes and for resumed handshakes (client re-presents its session).
+
+    python3 devel/tls_handshake_bench.py [-n HANDSHAKES] [--tls 1.2|1.3]
+'''
+import argparse
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from simpleWorkReporter import sslcert
+
+
+def serve(context: ssl.SSLContext, listener: socket.socket, count: int):
+    for _ in range(count):
+        conn, _addr = listener.accept()
+        try:
+            with context.wrap_socket(conn, server_side=True) as tls:
+                # One byte of application data lets the client receive the
+                # TLS 1.3 session tickets before closing
+                tls.sendall(b'.')
+                tls.recv(1)
+        except (ssl.SSLError, OSError):
+            pass
+
+
+def run_handshakes(port: int, client_ctx: ssl.SSLContext, count: int, resume: bool) -> list:
+    timings = []
+    session = None
+    for _ in range(count):
+        with socket.create_connection(('127.0.0.1', port)) as raw:
+            start = time.perf_counter()
+            with client_ctx.wrap_socket(raw, server_hostname='localhost', session=session) as tls:
+                timings.append(time.perf_counter() - start)
+                tls.recv(1)
+                tls.sendall(b'.')
+                if resume:
+                    session = tls.session
+    return timings
+
+
+def bench_key_type(key_type: str, count: int, tls_version: ssl.TLSVersion) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path = Path(tmp) / 'cert.pem'
+        key_path = Path(tmp) / 'key.pem'
+        start = time.perf_counter()
+        sslcert.create_ssl_files(cert_path, key_path, key_type=key_type)
+        keygen = time.perf_counter() - start
+
+        server_ctx = sslcert.build_ssl_context(cert_path, key_path)
+        client_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        client_ctx.check_hostname = False
+        client_ctx.verify_mode = ssl.CERT_NONE
+        client_ctx.minimum_version = tls_version
+        client_ctx.maximum_version = tls_version
+
+        results = {'key_type': key_type, 'keygen': keygen}
+        for label, resume in (('full', False), ('resumed', True)):
+            with socket.create_server(('127.0.0.1', 0)) as listener:
+                port = listener.getsockname()[1]
+                server = threading.Thread(
+                    target=serve, args=(server_ctx, listener, count), daemon=True
+                )
+                server.start()
+                timings = run_handshakes(port, client_ctx, count, resume)
+                server.join()
+            results[label] = timings
+        results['session_hits'] = server_ctx.session_stats().get('hits', 0)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--handshakes', type=int, default=200)
+    parser.add_argument('--tls', choices=['1.2', '1.3'], default='1.3')
+    args = parser.parse_args()
+    tls_version = ssl.TLSVersion.TLSv1_3 if args.tls == '1.3' else ssl.TLSVersion.TLSv1_2
+
+    print(f'TLS {args.tls}, {args.handshakes} handshakes per mode over loopback')
+    print(f'{"key":<8} {"keygen ms":>10} {"full ms":>9} {"full hs/s":>10} '
+          f'{"resumed ms":>11} {"resumed hs/s":>13} {"hits":>6}')
+    baseline = None
+    for key_type in ('rsa', 'ecdsa', 'ed25519'):
+        r = bench_key_type(key_type, args.handshakes, tls_version)
+        full = statistics.mean(r['full'])
+        resumed = statistics.mean(r['resumed'])
+        baseline = baseline or full
+        print(
+            f'{key_type:<8} {r["keygen"] * 1000:>10.1f} {full * 1000:>9.3f} '
+            f'{1 / full:>10.0f} {resumed * 1000:>11.3f} {1 / resumed:>13.0f} '
+            f'{r["session_hits"]:>6}   ({baseline / full:.1f}x rsa full)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+'''
+maintainDB.py
+
+Runs task database maintenance - PRAGMA optimize, ANALYZE, incremental
+vacuum and a WAL checkpoint - within a time budget.  The web service runs
+the same routine by itself when idle, except for the one time auto_vacuum
+migration of older databases (a full VACUUM), which only runs from here.
+Like sendReport.py, normal output is suppressed when stdout is not a tty.
+
+    maintainDB.py [--budget SECONDS] [--if-due] [--db PATH | --worker ID ... | --team]
+'''
+
+from simpleWorkReporter import defs
+from simpleWorkReporter import maintenance
+from simpleWorkReporter import team
+
+from simpleWorkReporter.errors import *
+from simpleWorkReporter.tasks import TaskDatabase
+
+import argparse
+import sys
+
+appname = defs.PACKAGE_NAME
+
+def ttyout(msg: str = ''):
+    ''' Wrapper for print to only stdout if stdout is tty '''
+    if sys.stdout.isatty():
+        print(msg)
+
+def errout(msg: str):
+    ''' Wrapper for printing to stderr for error messages regardless of tty '''
+    print(msg,file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Task database maintenance')
+    parser.add_argument('--budget', type=float, default=60,
+                        help='seconds allowed per database (default 60)')
+    parser.add_argument('--if-due', action='store_true',
+                        help='skip databases maintained within the maintenance interval')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--db', help=f'task database path (default {defs.TASKDB_FILE_PATH})')
+    target.add_argument('--worker', metavar='ID', action='append', help='team mode worker (repeatable)')
+    target.add_argument('--team', action='store_true', help='every team mode worker')
+    args = parser.parse_args()
+
+    try:
+        if args.worker or args.team:
+            registry = team.WorkerRegistry()
+            worker_ids = args.worker or team.list_workers()
+            task_dbs = [registry.get(worker_id).task_db for worker_id in worker_ids]
+        else:
+            task_dbs = [TaskDatabase(db_path=args.db)]
+    except (swrConfigError, swrDatabaseError) as e:
+        errout(f'{appname}: {e}')
+        exit(1)
+
+    incomplete = 0
+    for task_db in task_dbs:
+        if args.if_due:
+            results = maintenance.run_if_due(task_db, args.budget)
+        else:
+            results = maintenance.run_maintenance(task_db, args.budget)
+        if results is None:
+            ttyout(f'{task_db.db_path}: not due')
+            continue
+        ttyout(f'{task_db.db_path}:')
+        for step, result in results.items():
+            ttyout(f'  {step:<20} {result}')
+        if not maintenance.is_complete(results):
+            incomplete += 1
+            errout(f'{appname}: Maintenance of {task_db.db_path} did not complete')
+    exit(1 if incomplete else 0)
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+'''
+sendDigest.py
+
+Sends each manager one digest email combining the unsent tasks of all the
+team mode workers reporting to them (see startService.py --team), instead
+of one report per worker.  Like sendReport.py, normal output is suppressed
+when stdout is not a tty so it can run from cron.
+
+    sendDigest.py [--worker ID ...] [--dry-run]
+'''
+
+from simpleWorkReporter import defs
+from simpleWorkReporter import digest
+from simpleWorkReporter import render
+
+from simpleWorkReporter.errors import *
+
+import argparse
+import sys
+
+appname = defs.PACKAGE_NAME
+
+def ttyout(msg: str = ''):
+    ''' Wrapper for print to only stdout if stdout is tty '''
+    if sys.stdout.isatty():
+        print(msg)
+
+def errout(msg: str):
+    ''' Wrapper for printing to stderr for error messages regardless of tty '''
+    print(msg,file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send manager digests for team workers')
+    parser.add_argument('--worker', metavar='ID', action='append',
+                        help='only include this worker (repeatable, default all)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='render the digests without sending or marking tasks')
+    args = parser.parse_args()
+
+    ttyout("=" * 60)
+    ttyout("simpleWorkReporter - Send Manager Digests")
+    ttyout("=" * 60)
+    ttyout()
+
+    try:
+        results = digest.send_digests(
+            worker_ids=args.worker, env=render.get_environment(), dry_run=args.dry_run
+        )
+    except (swrConfigError, swrDatabaseError) as e:
+        errout(f'{appname}: Unable to build digests - {e}')
+        exit(1)
+
+    if not results:
+        errout(f'{appname}: No tasks to send...')
+        exit(1)
+    failed = 0
+    for manager_digest, result, message in results:
+        workers = ', '.join(s.worker.worker_id for s in manager_digest.sections)
+        if result:
+            action = 'Rendered' if args.dry_run else 'Sent'
+            ttyout(
+                f'{action} digest for {manager_digest.manager_email}: '
+                f'{len(manager_digest.tasks)} tasks from {workers}'
+            )
+        else:
+            failed += 1
+            errout(f'{appname}: Digest for {manager_digest.manager_email} failed - {message}')
+    exit(1 if failed else 0)
@@ -6,28 +6,35 @@ Provides commandline option to send the work summary report
 Script will suppress normal/informational output if it does not detect
   an interactive session on stdout.  This allows easy integration into
   cron type schedulers.
+
+    sendReport.py [--worker ID] [--trace jsonl|chrome]
+
+--worker sends the report of a team mode worker (see startService.py --team)
+--trace records where the send spent its time (see trace.py)
 '''
 
-from simpleWorkReporter import SimpleWorkReporter
 from simpleWorkReporter import defs
 
 from simpleWorkReporter.devtools import vardump
 from simpleWorkReporter import mailer
+from simpleWorkReporter import render
+from simpleWorkReporter import report
+from simpleWorkReporter import trace
+from simpleWorkReporter import team
 
 from simpleWorkReporter.errors import *
-from simpleWorkReporter.tasks import _get_date_range
-from simpleWorkReporter.app import _get_full_hostname
+from simpleWorkReporter.config import LoadSwrSettings
+from simpleWorkReporter.tasks import TaskDatabase, _get_date_range
 
+import argparse
 import sys
 import os
 
 appname = defs.PACKAGE_NAME
 
-# Jinja2 Template Setup and Pre-load
-from jinja2 import Environment, FileSystemLoader
-templates_dir = defs.DEFAULT_DATA_DIR / 'simpleWorkReporter/templates'
-jenv = Environment(loader=FileSystemLoader(templates_dir))
-report_template = jenv.get_template('report.html')
+# Jinja2 Template Setup and Pre-load (compiled templates are cached on disk)
+jenv = render.get_environment()
+jenv.get_template('report.html')
 
 def ttyout(msg: str = ''):
     ''' Wrapper for print to only stdout if stdout is tty '''
@@ -51,8 +58,20 @@ def print_header():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send the work summary report')
+    parser.add_argument('--worker', metavar='ID', help='team mode worker to send for')
+    parser.add_argument('--trace', choices=trace.TRACE_FORMATS,
+                        help=f'record spans to {defs.TRACE_FILE_PATH}.jsonl/.json')
+    args = parser.parse_args()
+    if args.trace:
+        trace.enable(args.trace)
     try:
-        app = SimpleWorkReporter()
+        if args.worker is not None:
+            worker = team.WorkerRegistry().get(args.worker)
+            app_settings, task_db = worker.settings, worker.task_db
+        else:
+            app_settings = LoadSwrSettings()
+            task_db = TaskDatabase(storage_profile=app_settings.storage_profile)
     except swrConfigError as e:
         errout(
             f'ERROR: Invalid or missing simpleWorkReporter configuration file.\n'
@@ -63,24 +82,17 @@ if __name__ == '__main__':
         exit(1)
 
     print_header()
-    settings = dict(app.settings)
-    tasks = app.task_db.get_unsent_tasks()
-    date_range = _get_date_range(tasks)
-    service_host = _get_full_hostname()
+    settings = app_settings.snapshot
+    tasks = task_db.get_unsent_tasks()
 
     if not len(tasks):
         errout(f'{appname}: No tasks to send...')
         exit(1)
+    date_range = _get_date_range(tasks)
     # load the email details
     SENDFROM = mailer._get_send_from(settings)
     SENDTO   = mailer._get_send_to(settings)
     SUBJECT  = mailer._get_email_subject(settings, date_range)
-    report_body = report_template.render(
-        settings=settings,
-        date_range=date_range,
-        tasks=tasks,
-        service_host=service_host
-    )
     ttyout(
         f'Sending report containing {len(tasks)} using the following details:\n'
         f'\tFrom: {SENDFROM}\n'
@@ -88,16 +100,13 @@ if __name__ == '__main__':
         f'\tSubj: {SUBJECT}\n'
         f'... via SMTP server [{settings["smtp"]}]:25'
     )
-    result, message = mailer.send_report_email(
-        settings,
-        report_body,
-        date_range
+    result, message = report.send_report(
+        settings, task_db, tasks=tasks, env=jenv
     )
     if not result:
         errout(f'{appname}: Unable to send report email - {message}')
         exit(1)
     else:
-        app.task_db.set_tasks_as_sent(tasks)
         ttyout(f'Successfully sent email.')
         exit(0)
 
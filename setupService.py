@@ -1,10 +1,11 @@
 #!/usr/bin/python3
+import argparse
 import os
 import sys
 from enum import Enum, auto
 from pathlib import Path
 
-from simpleWorkReporter import config, defs, sslcert, syslog
+from simpleWorkReporter import config, defs, sslcert, syslog, team
 from simpleWorkReporter.errors import *
 
 config_path = defs.CONFIG_FILE_PATH
@@ -190,6 +191,26 @@ def prompt_ssl_setup():
     return prompt_yes_no("Create self-signed SSL certificates?", default=True)
 
 
+def prompt_ssl_key_type() -> str:
+    """Prompt user for the certificate key type."""
+    print()
+    print("  ecdsa   - ECDSA P-256, fast handshakes and broad browser support (recommended)")
+    print("  ed25519 - Ed25519, fastest but most browsers reject it for HTTPS")
+    print("  rsa     - RSA 4096, slow to generate and slower handshakes")
+    print()
+    while True:
+        try:
+            response = input(f"Key type [{defs.SSL_KEY_TYPE}]: ").strip().lower()
+        except (KeyboardInterrupt, EOFError):
+            print("\n\nSetup interrupted.")
+            sys.exit(1)
+        if not response:
+            return defs.SSL_KEY_TYPE
+        if response in defs.SSL_KEY_TYPES:
+            return response
+        print(f"Please enter one of: {', '.join(defs.SSL_KEY_TYPES)}")
+
+
 def prompt_ssl_file_removal():
     """Prompt user to remove invalid SSL files."""
     print_error("Existing SSL certificate files are invalid:")
@@ -291,7 +312,8 @@ def wizard__update(config_path: Path, settings: dict = {}):
     
     print()
     print_success("Configuration updated successfully!")
-    print("Restart the service for changes to take effect.")
+    print("A running service picks up the changes automatically.")
+    print("Restart the service if the Service_Port was changed.")
     sys.exit(0)
 
 
@@ -310,12 +332,15 @@ def wizard__sslsetup():
     """Handle SSL certificate setup."""
     if not sslcert.is_ssl_configured(defs.SSL_CERT_FILE, defs.SSL_KEY_FILE):
         if prompt_ssl_setup():
+            key_type = prompt_ssl_key_type()
             print("Creating SSL certificate files...")
             print(f"  Certificate: {defs.SSL_CERT_FILE}")
-            print(f"  Private Key: {defs.SSL_KEY_FILE}")
+            print(f"  Private Key: {defs.SSL_KEY_FILE} ({key_type})")
             
             try:
-                sslcert.create_ssl_files(defs.SSL_CERT_FILE, defs.SSL_KEY_FILE)
+                sslcert.create_ssl_files(
+                    defs.SSL_CERT_FILE, defs.SSL_KEY_FILE, key_type=key_type
+                )
                 print_success("SSL certificates created successfully")
             except Exception as e:
                 print_error(f"Failed to create SSL certificates: {e}")
@@ -345,9 +370,31 @@ def determine_run_mode(config_path):
         return RunMode.RESET, settings, str(e)
 
 
+def get_team_config_path(worker_id: str) -> Path:
+    """Config path for a team worker, creating the worker directory."""
+    try:
+        worker_dir = team.get_worker_dir(worker_id.strip().lower())
+    except swrConfigError as e:
+        print_error(str(e))
+        sys.exit(1)
+    os.makedirs(worker_dir, exist_ok=True)
+    print(f"Team worker: {worker_dir.name}")
+    print("  Service_Port is not used by team workers, the team service")
+    print("  port is set with: python3 startService.py --team --port <port>")
+    return worker_dir / defs.CONFIG_FILE_NAME
+
+
 def main():
     """Main setup function."""
+    global config_path
+    parser = argparse.ArgumentParser(description="simpleWorkReporter setup wizard")
+    parser.add_argument("--worker", metavar="ID",
+                        help="set up (or update) a team mode worker instead of worker.conf")
+    args = parser.parse_args()
+
     print_header()
+    if args.worker is not None:
+        config_path = get_team_config_path(args.worker)
     
     # Handle SSL setup first
     wizard__sslsetup()
@@ -3,7 +3,14 @@ simpleWorkReporter __init__
 --
 Keep the primary package namespace clean by only importing the externally
 useful class objects.
+
+SimpleWorkReporter is loaded on first access so scripts that only need the
+headless modules (report, tasks, config, mailer) don't import flask.
 '''
-from . import dependencies
-from .app import SimpleWorkReporter
 
+def __getattr__(name: str):
+    if name == 'SimpleWorkReporter':
+        from . import dependencies
+        from .app import SimpleWorkReporter
+        return SimpleWorkReporter
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -15,7 +15,8 @@ Usage:
 # Flask specific imports (maybe I should just import flask?
 from flask import (
     Flask, render_template, request, 
-    flash, redirect, url_for, session
+    flash, redirect, url_for, session,
+    abort, send_file, Response, g
 )
 from urllib.parse import urlparse, urlunparse
 from pathlib import Path
@@ -23,43 +24,301 @@ from datetime import datetime
 from ssl import SSLError
 import time
 import os
-import socket
-import subprocess
+import json
+import tempfile
 
 from . import defs
 from . import syslog
+from . import render
+from . import trace
+from . import querylog
 from .config import LoadSwrSettings, UpdateResult, _hash_password
 from .tasks import TaskDatabase, _get_date_range
-from .mailer import send_report_email
+from .report import send_report, resend_report, open_report_body, get_full_hostname
+from .sslcert import build_ssl_context
+from .assets import AssetManifest
+from .compression import compress_response
+from .scheduler import Scheduler, ScheduledJob, parse_schedules, get_job_name
+from .team import WorkerRegistry, get_team_secret_key
+from .maintenance import MaintenanceTimer
+from . import backup
 from .errors import *
 from .devtools import vardump
 
 
 class SimpleWorkReporter():
-    def __init__(self, config_path: Path = None, db_path: Path = None):
+    '''
+    Single worker service by default.  Passing team_dir runs team mode, where
+    each logged in worker gets their own settings and task DB from
+    team_dir/<worker_id>/ (see team.py) and team_port is the listen port.
+    '''
+    def __init__(self, config_path: Path = None, db_path: Path = None,
+                 team_dir: Path = None, team_port: int = None):
         self.app = Flask(__name__)
-        self.settings = LoadSwrSettings(config_path=config_path)
-        self.app.secret_key = self.settings._get_server_key_from_access()
-        self.task_db = TaskDatabase(db_path=db_path)
+        # Share the compiled template cache with sendReport.py
+        self.app.jinja_options = dict(
+            self.app.jinja_options, bytecode_cache=render.get_bytecode_cache()
+        )
+        self.app.jinja_env.template_class = render.TracedTemplate
+        self.team = WorkerRegistry(team_dir) if team_dir else None
+        if self.team is None:
+            self._settings = LoadSwrSettings(config_path=config_path)
+            self.app.secret_key = self._settings._get_server_key_from_access()
+            self._task_db = TaskDatabase(
+                db_path=db_path, storage_profile=self._settings.storage_profile
+            )
+            self._bound_service_port = str(self._settings.service_port)
+            self._apply_log_rotation()
+            self._apply_slow_query_log()
+        else:
+            self._settings = self._task_db = None
+            self.app.secret_key = get_team_secret_key(team_dir)
+            self._bound_service_port = str(team_port or defs.TEAM_SERVICE_PORT)
         self.new_service_port = None # Used if port update requires restart
+        self.scheduler = None
+        self.maintenance = None
+        self._last_request = time.monotonic()
+        self._scheduled_jobs = (None, [])  # (schedule value, jobs)
+        self.assets = AssetManifest()
+        self.app.add_template_global(self._asset_url, 'asset_url')
         self._set_routes()
-    
+        self._warm_up()
+
+    @property
+    def settings(self) -> LoadSwrSettings:
+        ''' Settings of the service's worker, or the request's team worker '''
+        if self.team is None:
+            return self._settings
+        return self._get_team_worker().settings
+
+    @property
+    def task_db(self) -> TaskDatabase:
+        ''' Task DB of the service's worker, or the request's team worker '''
+        if self.team is None:
+            return self._task_db
+        return self._get_team_worker().task_db
+
+    def _get_team_worker(self):
+        worker = g.get('worker')
+        if worker is None:
+            # Only reachable from a route missing the team login check
+            raise swrInternalError()
+        return worker
+
+    def _warm_up(self):
+        '''
+        Precompile all templates and prime the DB and hostname lookups so
+        the first request doesn't pay for them.
+        '''
+        template_count = render.warm_templates(self.app.jinja_env)
+        self.assets.build()
+        if self.team is None:
+            self.task_db.get_unsent_tasks_count()
+            service_host = get_full_hostname(self.settings.service_host)
+        else:
+            service_host = get_full_hostname()
+        syslog.dbg(
+            f'Warm-up complete: {template_count} templates loaded, '
+            f'service host {service_host}'
+        )
+
+    def _asset_url(self, filename: str) -> str:
+        ''' Template helper - fingerprinted URL for a static file '''
+        fingerprinted = self.assets.url_name(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename)
+        return url_for('www_asset', filename=fingerprinted)
+
+    def _refresh_settings(self):
+        '''
+        Reload the settings snapshot if worker.conf changed on disk and apply
+        the parts of the running service that depend on it.
+        '''
+        if not self.settings.refresh() or self.team is not None:
+            return
+        self.app.secret_key = self.settings._get_server_key_from_access()
+        self._apply_log_rotation()
+        self._apply_slow_query_log()
+        if str(self.settings.service_port) != self._bound_service_port:
+            self.new_service_port = True
+        if self.settings.storage_profile != self._task_db.storage_profile:
+            try:
+                self._task_db.set_storage_profile(self.settings.storage_profile)
+            except swrConfigError as e:
+                syslog.msg(f'Storage_Profile change ignored: {e}')
+
+    def _get_scheduled_jobs(self) -> list:
+        '''
+        Scheduler job source -- builds the report and backup jobs from the
+        current Report_Schedule / Backup_Schedule values, re-parsing only
+        when a setting changes.
+        '''
+        self._refresh_settings()
+        schedule_value = (self.settings.report_schedule, self.settings.backup_schedule)
+        if schedule_value != self._scheduled_jobs[0]:
+            jobs = []
+            for prefix, setting, value, action in (
+                ('report', 'Report_Schedule', schedule_value[0], self._scheduled_send),
+                ('backup', 'Backup_Schedule', schedule_value[1], self._scheduled_backup),
+            ):
+                try:
+                    jobs += [
+                        ScheduledJob(
+                            get_job_name(prefix, schedule.expression),
+                            schedule,
+                            action
+                        )
+                        for schedule in parse_schedules(value)
+                    ]
+                except swrConfigError as e:
+                    syslog.msg(f'{setting} ignored: {e}')
+            self._scheduled_jobs = (schedule_value, jobs)
+        return self._scheduled_jobs[1]
+
+    def _apply_log_rotation(self):
+        ''' Service log rotation limits from worker.conf, defs values if invalid '''
+        limits = []
+        for key, scale in (('Log_Max_Bytes', 1), ('Log_Rotate_Hours', 3600), ('Log_Keep', 1)):
+            try:
+                limits.append(float(getattr(self.settings, key.lower())) * scale)
+            except ValueError:
+                limits.append(float(defs.OPTIONAL_CONF_VALUES[key]['default']) * scale)
+        syslog.set_rotation(*limits)
+
+    def _apply_slow_query_log(self):
+        try:
+            querylog.set_threshold(float(self.settings.slow_query_ms))
+        except ValueError:
+            querylog.set_threshold(defs.SLOW_QUERY_MS)
+
+    def _get_catchup_hours(self) -> float:
+        try:
+            return float(self.settings.schedule_catchup_hours)
+        except ValueError:
+            return float(defs.OPTIONAL_CONF_VALUES['Schedule_Catchup_Hours']['default'])
+
+    def _scheduled_send(self):
+        ''' Scheduled report send using the service's loaded templates and DB '''
+        if not self.task_db.get_unsent_tasks_count():
+            syslog.msg('Scheduled send skipped, no unsent tasks.')
+            return
+        result, message = send_report(
+            self.settings.snapshot, self.task_db, env=self.app.jinja_env
+        )
+        if not result:
+            syslog.msg(f'Scheduled send failed: {message}')
+
+    def _get_backup_keep(self) -> int:
+        try:
+            return int(self.settings.backup_keep)
+        except ValueError:
+            return int(defs.OPTIONAL_CONF_VALUES['Backup_Keep']['default'])
+
+    def _scheduled_backup(self):
+        backup.backup_database(self.task_db, keep=self._get_backup_keep())
+
+    def _start_scheduler(self):
+        if self.scheduler is not None:
+            return
+        # Validate the configured schedules up front so typos are visible
+        try:
+            parse_schedules(self.settings.report_schedule)
+        except swrConfigError as e:
+            print(f'WARNING: {e} -- scheduled sends are disabled until it is fixed.')
+        try:
+            parse_schedules(self.settings.backup_schedule)
+        except swrConfigError as e:
+            print(f'WARNING: {e} -- scheduled backups are disabled until it is fixed.')
+        self.scheduler = Scheduler(self._get_scheduled_jobs, self._get_catchup_hours)
+        self.scheduler.start()
+
+    def _get_maintained_dbs(self) -> list:
+        ''' Task DBs for idle maintenance - in team mode the loaded workers' '''
+        if self.team is None:
+            return [self._task_db]
+        return [worker.task_db for worker in self.team.loaded()]
+
+    def _start_maintenance(self):
+        if self.maintenance is not None:
+            return
+        self.maintenance = MaintenanceTimer(
+            self._get_maintained_dbs, lambda: self._last_request
+        )
+        self.maintenance.start()
+
+    def _event_stream(self, task_db: TaskDatabase, last_event_id: int):
+        '''
+        Generator behind /events, one SSE message per task change event.
+        Runs after the request context is gone, so it is handed the task DB.
+        '''
+        yield 'retry: 5000\n\n'
+        last_sent = time.monotonic()
+        while True:
+            events = task_db.wait_for_events(last_event_id, defs.SSE_POLL_INTERVAL)
+            for event in events:
+                last_event_id = event['id']
+                data = {'ids': event['task_ids']}
+                if event['event'] in ('add', 'edit'):
+                    data['tasks'] = [
+                        task for task in map(task_db.get_task, event['task_ids'])
+                        if task is not None
+                    ]
+                yield (
+                    f'id: {event["id"]}\n'
+                    f'event: {event["event"]}\n'
+                    f'data: {json.dumps(data)}\n\n'
+                )
+                last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= defs.SSE_KEEPALIVE_INTERVAL:
+                # Comment line keeps proxies from timing out the connection
+                # and lets the server notice closed tabs
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+
+    def _fragment_task_row(self, task_id) -> Response:
+        ''' Response for a fetch() task submit - the task's row and unsent tally '''
+        task = self.task_db.get_task(task_id) if task_id is not None else None
+        body = render_template('_task_row.html', task=task) if task else ''
+        response = Response(body, mimetype='text/html')
+        response.headers['X-Unsent-Count'] = str(self.task_db.get_unsent_tasks_count())
+        return response
+
+    def _fragment_error(self, message: str, status: int) -> Response:
+        syslog.msg(f'Task submit failed: {message}')
+        return Response(message, status=status, mimetype='text/plain')
+
     def _set_routes(self):
         # Add before_request handler for global port change detection
         @self.app.before_request
         def before_requests_handler():
+            g.trace_span = trace.start(
+                f'{request.method} {request.url_rule or request.path}', path=request.path
+            )
+            if request.path.startswith(defs.STATIC_URL_PREFIXES):
+                return
+            # Idle time tracking for background DB maintenance
+            self._last_request = time.monotonic()
+            # Team mode - load the logged in worker's settings and task DB
+            if self.team is not None:
+                worker_id = session.get('worker')
+                g.worker = self.team.find(worker_id) if worker_id else None
+                if g.worker is None:
+                    session.pop('authenticated', None)
+            # Pick up config file changes (setupService.py, manual edits)
+            if self.team is None or g.worker is not None:
+                self._refresh_settings()
             # Server Restart Required Redirect
             if (
                 self.new_service_port 
                 and request.endpoint != 'www_restart' 
-                and not request.path.startswith('/static/')
+                and not request.path.startswith(defs.STATIC_URL_PREFIXES)
             ):
                 # If port change is pending and user is not already on restart page, redirect
                 return redirect(url_for('www_restart'))
             # Authentication check and redirect
             if (
                 request.endpoint not in defs.ALLOWED_ENDPOINTS_WITHOUT_AUTH and
-                not request.path.startswith('/static/') and
+                not request.path.startswith(defs.STATIC_URL_PREFIXES) and
                 not session.get('authenticated')
             ):
                 # Missing authentication
@@ -69,16 +328,85 @@ class SimpleWorkReporter():
                     next_url = url_for('www_index')
                 return redirect(url_for('www_login', next=next_url))
         
+        @self.app.after_request
+        def after_request_handler(response):
+            span = g.get('trace_span')
+            if span is not None:
+                span.set(status=response.status_code)
+            return compress_response(response, request.accept_encodings)
+
+        @self.app.teardown_request
+        def teardown_request_handler(error):
+            span = g.pop('trace_span', None)
+            if span is not None:
+                span.end(error)
+
+        @self.app.route('/assets/<path:filename>')
+        def www_asset(filename):
+            ''' Fingerprinted static files, precompressed where possible '''
+            asset = self.assets.lookup(filename)
+            if asset is None:
+                abort(404)
+            encoding = self.assets.negotiate(asset, request.accept_encodings)
+            path = asset.encoded[encoding] if encoding else asset.path
+            response = send_file(
+                path, mimetype=asset.mimetype,
+                etag=f'{asset.digest}-{encoding or "identity"}'
+            )
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+            response.headers['Cache-Control'] = (
+                f'public, max-age={defs.STATIC_MAX_AGE}, immutable'
+            )
+            return response
+
         @self.app.route('/')
         def www_index():
             page_title = f"Daily Tasks"
+            # Read the change counter first so no later change is missed
+            last_event_id = self.task_db.get_change_counter()
             tasks = self.task_db.get_unsent_tasks()
             return render_template(
                 'index.html', 
                 page_title=page_title, 
                 page_index=True,
                 tasks=tasks,
-                settings=dict(self.settings)
+                unsent_count=len(tasks),
+                last_event_id=last_event_id,
+                settings=self.settings.snapshot
+            )
+
+        @self.app.route('/events')
+        def www_events():
+            '''
+            Server-Sent Events stream of task changes for open pages.  Resumes
+            from the Last-Event-ID header (reconnects) or the ?last= argument.
+            '''
+            last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last')
+            try:
+                last_event_id = int(last_event_id)
+            except (TypeError, ValueError):
+                last_event_id = self.task_db.get_change_counter()
+            return Response(
+                self._event_stream(self.task_db, last_event_id),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        @self.app.route('/fragment/task/<int:task_id>')
+        def www_fragment_task(task_id):
+            ''' Single unsent task table row, for in-place page updates '''
+            task = self.task_db.get_task(task_id)
+            if not task or task['sent']:
+                abort(404)
+            return render_template('_task_row.html', task=task)
+
+        @self.app.route('/fragment/unsent/count')
+        def www_fragment_unsent_count():
+            return render_template(
+                '_unsent_count.html',
+                unsent_count=self.task_db.get_unsent_tasks_count()
             )
 
         @self.app.route('/config')
@@ -88,13 +416,19 @@ class SimpleWorkReporter():
                 'config.html', 
                 page_title=page_title,
                 page_config=True,
-                settings=dict(self.settings)
+                team_mode=self.team is not None,
+                settings=self.settings.snapshot
             )
         
         @self.app.route('/update/config', methods=['POST'])
         def www_update_config():
+            # Team workers share the team service port, theirs is unused
+            service_port = (
+                request.form.get('servicePort') if self.team is None
+                else self.settings.service_port
+            )
             result, message = self.settings.update_config(
-                service_port = request.form.get('servicePort'),
+                service_port = service_port,
                 worker_name = request.form.get('workerName'),
                 worker_email = request.form.get('workerEmail'),
                 manager_name = request.form.get('managerName'),
@@ -138,12 +472,38 @@ class SimpleWorkReporter():
                 id=id,
                 task=task,
                 delete_confirm=delete_confirm,
-                settings=dict(self.settings)
+                settings=self.settings.snapshot
             )
 
         @self.app.route('/alltasks')
         def www_view_all_tasks():
-            tasks = self.task_db.get_tasks(order_by="id DESC")
+            '''
+            All tasks, newest first, narrowed by the type, subtype, from, to
+            and sent query parameters, with facet counts for each filter
+            '''
+            task_filter = {
+                'task_type': request.args.get('type', '').strip(),
+                'task_subtype': request.args.get('subtype', '').strip(),
+                'date_from': request.args.get('from', '').strip(),
+                'date_to': request.args.get('to', '').strip(),
+                'sent': {'sent': True, 'unsent': False}.get(request.args.get('sent', '')),
+            }
+            try:
+                tasks = self.task_db.get_tasks(
+                    order_by="id DESC", limit=defs.TASK_LIST_LIMIT, **task_filter
+                )
+            except ValueError:
+                flash('Dates must be in YYYY-MM-DD format, date filter ignored.', 'warning')
+                task_filter.update(date_from='', date_to='')
+                tasks = self.task_db.get_tasks(
+                    order_by="id DESC", limit=defs.TASK_LIST_LIMIT, **task_filter
+                )
+            facets = self.task_db.get_task_facets(**task_filter)
+            # The sent facet is counted without the sent filter
+            if task_filter['sent'] is None:
+                task_count = facets['sent']['sent'] + facets['sent']['unsent']
+            else:
+                task_count = facets['sent']['sent' if task_filter['sent'] else 'unsent']
             page_title = f'All Tasks'
             task_action = "alltasks"
             return render_template(
@@ -151,16 +511,28 @@ class SimpleWorkReporter():
                 page_title=page_title,
                 page_alltasks=True,
                 tasks=tasks,
-                settings=dict(self.settings)
+                facets=facets,
+                task_count=task_count,
+                task_filter=request.args.to_dict(),
+                settings=self.settings.snapshot
             )
 
 
 
         @self.app.route('/submit/task', methods=['POST'])
         def www_submit_task():
-            ''' Task Add/Update/Delete workflow '''
+            '''
+            Task Add/Update/Delete workflow
+
+            Plain form posts are redirected back to the home page.  Posts made
+            by the page scripts (defs.FRAGMENT_REQUEST_HEADER set) get back only
+            the affected table row, or an empty body for a delete, with the
+            unsent tally in the X-Unsent-Count header.  Failures are returned
+            as a plain text message with a 4xx/5xx status.
+            '''
             is_new = request.form.get('newTask','') == 'newTask'
             is_delete = request.form.get('deleteTask','') == 'confirmed'
+            is_fragment = defs.FRAGMENT_REQUEST_HEADER in request.headers
 
             # Extract form data and validate required forms filled out
             try:
@@ -170,10 +542,13 @@ class SimpleWorkReporter():
                 description = request.form['description']
                 date = request.form.get('workDate',None)
             except Exception as e:
-                flash(
+                message = (
                     f'Expected Task value for "{e.args[0]}" was not found.'
-                    f' Unable to process.','error'
+                    f' Unable to process.'
                 )
+                if is_fragment:
+                    return self._fragment_error(message, 400)
+                flash(message,'error')
                 return redirect(url_for('www_index'))
 
             if is_new:
@@ -181,24 +556,38 @@ class SimpleWorkReporter():
                     taskType, taskSubType, description, date
                 )
                 if not result:
-                    flash(f'New task submission failed: {message}','error')
+                    message = f'New task submission failed: {message}'
+                    if is_fragment:
+                        return self._fragment_error(message, 500)
+                    flash(message,'error')
                 else:
                     # flash(f'New task submitted successfully.','success')
                     # Dont really need to add a flash, they'll see the new task
-                    pass
+                    if is_fragment:
+                        return self._fragment_task_row(message)
             elif is_delete:
                 if self.task_db.delete_task(taskId):
+                    if is_fragment:
+                        return self._fragment_task_row(None)
                     flash(f'Successfully deleted task {taskId}','success')
                 else:
-                    flash(f'An issue occrred while deleting task {taskId}','warning')  
+                    message = f'An issue occrred while deleting task {taskId}'
+                    if is_fragment:
+                        return self._fragment_error(message, 404)
+                    flash(message,'warning')
             else:
                 # Edit Existing Task
                 result, message = self.task_db.edit_task(
                     taskId,taskType,taskSubType,description,date
                 )
                 if not result:
-                    flash(f'Task edit failed: {message}','error')
+                    message = f'Task edit failed: {message}'
+                    if is_fragment:
+                        return self._fragment_error(message, 500)
+                    flash(message,'error')
                 else:
+                    if is_fragment:
+                        return self._fragment_task_row(taskId)
                     flash(f'Task {taskId} successfully updated.','success')
 
             # Send back to home page regardless of outcome
@@ -216,11 +605,11 @@ class SimpleWorkReporter():
                 return redirect(url_for('www_index'))
 
             date_range = _get_date_range(tasks)
-            service_host = _get_full_hostname()
+            service_host = get_full_hostname(self.settings.service_host)
 
             return render_template('send.html',
                 page_title=page_title,
-                settings=dict(self.settings),
+                settings=self.settings.snapshot,
                 date_range=date_range,
                 tasks=tasks,
                 service_host=service_host,
@@ -242,59 +631,131 @@ class SimpleWorkReporter():
                 flash(f'No unsent tasks available to report.','warning')
                 return redirect(url_for('www_index'))
 
-            date_range = _get_date_range(tasks)
-            service_host = _get_full_hostname()
-
-            # Generate the report text body
-            report_body = render_template('report.html',
-                settings=dict(self.settings),
-                date_range=date_range,
-                tasks=tasks,
-                service_host=service_host
-            )
-            # Attempt to send the email
-            result, message = send_report_email(
-                dict(self.settings), report_body, date_range
+            result, message = send_report(
+                self.settings.snapshot, self.task_db, tasks=tasks,
+                env=self.app.jinja_env
             )
             if not result:
                 flash(f'Unable to send email: {message}','warning')
                 return redirect(url_for('www_send_report'))
             else:
-                # Update the reported tasks as sent
-                self.task_db.set_tasks_as_sent(tasks)
                 flash(f'Work summary email successfully sent.','success')
                 return redirect(url_for('www_index'))
 
 
+        @self.app.route('/reports')
+        def www_reports():
+            ''' Sent report history '''
+            page_title = 'Sent Reports'
+            reports = self.task_db.get_reports(limit=defs.TASK_LIST_LIMIT)
+            return render_template(
+                'reports.html',
+                page_title=page_title,
+                page_reports=True,
+                reports=reports,
+                settings=self.settings.snapshot
+            )
+
+        @self.app.route('/report/<int:report_id>')
+        def www_view_report(report_id):
+            '''
+            Serve a stored report body.  The stored zlib stream is valid HTTP
+            "deflate" content, so it is sent as-is when the client accepts it.
+            '''
+            report = self.task_db.get_report(report_id)
+            if report is None:
+                flash(f'Report ID {report_id} does not exist.','warning')
+                return redirect(url_for('www_reports'))
+            if request.accept_encodings['deflate']:
+                response = Response(report['body'], mimetype='text/html')
+                response.headers['Content-Encoding'] = 'deflate'
+            else:
+                with open_report_body(report['body']) as body:
+                    response = Response(body.read(), mimetype='text/html')
+            response.vary.add('Accept-Encoding')
+            return response
+
+        @self.app.route('/report/<int:report_id>/resend', methods=['POST'])
+        def www_resend_report(report_id):
+            result, message = resend_report(
+                self.settings.snapshot, self.task_db, report_id
+            )
+            if not result:
+                flash(f'Unable to re-send report {report_id}: {message}','warning')
+            else:
+                flash(f'Report {report_id} re-sent successfully.','success')
+            return redirect(url_for('www_reports'))
+
+
+        @self.app.route('/backup')
+        def www_backup():
+            '''
+            Download a consistent, gzip compressed snapshot of the task DB,
+            taken online while the service keeps running
+            '''
+            out = tempfile.TemporaryFile()
+            try:
+                backup.write_backup(self.task_db, out)
+            except swrDatabaseError as e:
+                out.close()
+                syslog.msg(str(e))
+                flash(f'Database backup failed: {e}', 'error')
+                return redirect(url_for('www_config'))
+            out.seek(0)
+            response = send_file(
+                out,
+                mimetype='application/gzip',
+                as_attachment=True,
+                download_name=backup.get_backup_name(self.task_db),
+                max_age=0
+            )
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
         @self.app.route('/login', methods=['GET','POST'])
         def www_login():
             if request.method == "POST":
                 password = request.form.get('password','')
-                if self.settings.is_pass_valid(password):
+                if self.team is not None:
+                    # Team mode - check against the named worker's Access key
+                    worker_id = request.form.get('worker','').strip().lower()
+                    g.worker = self.team.find(worker_id) if worker_id else None
+                    if g.worker is not None:
+                        session['worker'] = worker_id
+                if (
+                    (self.team is None or g.worker is not None)
+                    and self.settings.is_pass_valid(password)
+                ):
                     session['authenticated'] = True
                     session.permanent = True # Use PERMANENT_SESSION_LIFETIME
                     flash('Login successful.', 'success')
                     next_url = request.args.get('next') or url_for('www_index')
                     return redirect(next_url)
                 else:
-                    flash('Invalid password.', 'error')
-            return render_template('login.html', page_title="Login")                
+                    session.pop('worker', None)
+                    flash('Invalid password.' if self.team is None
+                          else 'Invalid worker or password.', 'error')
+            return render_template('login.html', page_title="Login", team_mode=self.team is not None)
             
             page_title = "Login"
             return render_template('login.html',
                 page_title=page_title,
-                settings=dict(self.settings)
+                settings=self.settings.snapshot
             )
         
         @self.app.route('/logout')
         def www_logout():
             session.pop('authenticated', None)
+            session.pop('worker', None)
             flash('You have been logged out.', 'info')
             return redirect(url_for('www_login'))
 
 
         @self.app.route('/restart')
         def www_restart():
+            if self.team is not None:
+                # Team mode listens on the team port, worker ports are unused
+                return redirect(url_for('www_index'))
             # Build the new target URL after service restart based on new port value
             current_url = request.url
             parsed_url = urlparse(current_url)
@@ -312,17 +773,32 @@ class SimpleWorkReporter():
 
     
     def run(self):
-        ssl_context = _check_for_ssl_context()
+        try:
+            ssl_context = _check_for_ssl_context()
+        except SSLError:
+            print(
+                f'ERROR: There is an issue with the SSL cert and key files:\n'
+                f'{defs.SSL_CERT_FILE}, {defs.SSL_KEY_FILE}\n'
+                f'Run setupService.py for assistance regenerating corrupt SSL files.'
+            )
+            exit(1)
+        # run() always uses the debug reloader: the parent process only
+        # watches files, so background services start in the serving child.
+        # Team workers schedule sends with cron and sendReport.py --worker
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            if self.team is None:
+                self._start_scheduler()
+            self._start_maintenance()
         try:
             self.app.run(
                 host='0.0.0.0', 
-                port=self.settings.service_port,
+                port=int(self._bound_service_port),
                 ssl_context=ssl_context,
                 debug=True)
         except SSLError:
             print(
                 f'ERROR: There is an issue with the SSL cert and key files:\n'
-                f'{", ".join([str(x) for x in ssl_context])}\n'
+                f'{defs.SSL_CERT_FILE}, {defs.SSL_KEY_FILE}\n'
                 f'Run setupService.py for assistance regenerating corrupt SSL files.'
             )
             exit(1)
@@ -340,7 +816,7 @@ def _check_for_ssl_context():
         os.path.isfile(defs.SSL_CERT_FILE)
         and os.path.isfile(defs.SSL_KEY_FILE)
     ):
-        ssl_context = (defs.SSL_CERT_FILE, defs.SSL_KEY_FILE)
+        ssl_context = build_ssl_context(defs.SSL_CERT_FILE, defs.SSL_KEY_FILE)
     # Print a warning message about HTTP mode if no SSL context set
     if ssl_context is None:
         print(
@@ -351,15 +827,3 @@ def _check_for_ssl_context():
             f'Continuing in HTTP mode...'
         )
     return ssl_context
-
-def _get_full_hostname() -> str:
-  if os.name == 'posix':
-    result = subprocess.run(['hostname','-f'],capture_output=True, text=True)
-    return result.stdout.strip()
-  if os.name == 'nt':
-    hostname = socket.gethostname()
-    domain = os.getenv('USERDOMAIN')
-    if domain: hostname += f'.{domain}'
-    return hostname
-  # who knows... return something
-  return socket.gethostname()
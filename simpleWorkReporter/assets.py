@@ -0,0 +1,153 @@
+'''
+simpleWorkReporter - assets.py
+--
+Static asset pipeline.  Each file under static/ is content-hashed into a
+fingerprinted name (css/style.css -> css/style.<hash>.css) and text-like
+files are precompressed (gzip, plus brotli when the module is installed)
+into defs.STATIC_CACHE_DIR.  Fingerprinted URLs never change content, so
+they are served with a long-lived immutable Cache-Control header and repeat
+page loads don't re-request them at all.
+'''
+from . import defs
+from . import syslog
+
+from pathlib import Path
+from typing import Optional
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in server preference order
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json',
+    'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon'
+)
+
+
+class StaticAsset():
+    ''' A fingerprinted static file and its precompressed variants '''
+    def __init__(self, name: str, path: Path, digest: str, stamp: tuple):
+        self.name = name
+        self.path = path
+        self.digest = digest
+        self.stamp = stamp
+        stem, suffix = os.path.splitext(name)
+        self.fingerprinted = f'{stem}.{digest}{suffix}'
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.encoded = {}  # encoding -> precompressed file path
+
+    def __repr__(self):
+        return f'StaticAsset({self.fingerprinted!r})'
+
+
+class AssetManifest():
+    '''
+    Maps logical static file names to fingerprinted names and back.  Entries
+    are re-hashed if the source file changes while the service is running.
+    '''
+    def __init__(self, static_dir: Path = None, cache_dir: Path = None):
+        self.static_dir = Path(static_dir or defs.STATIC_DIR)
+        self.cache_dir = Path(cache_dir or defs.STATIC_CACHE_DIR)
+        self._by_name = {}
+        self._by_fingerprint = {}
+
+    def build(self) -> int:
+        ''' Fingerprint and precompress every static file.  Returns the file count '''
+        for root, _dirs, files in os.walk(self.static_dir):
+            for file_name in files:
+                path = Path(root) / file_name
+                self._add(path.relative_to(self.static_dir).as_posix())
+        syslog.dbg(f'Static asset manifest built with {len(self._by_name)} files')
+        return len(self._by_name)
+
+    def url_name(self, name: str) -> Optional[str]:
+        ''' Fingerprinted name for a logical static file name, or None '''
+        asset = self._current(name)
+        return asset.fingerprinted if asset else None
+
+    def lookup(self, fingerprinted: str) -> Optional[StaticAsset]:
+        asset = self._by_fingerprint.get(fingerprinted)
+        if asset is None:
+            return None
+        # The file may have been edited since, only serve the hashed content
+        current = self._current(asset.name)
+        if current is None or current.fingerprinted != fingerprinted:
+            return None
+        return current
+
+    def _current(self, name: str) -> Optional[StaticAsset]:
+        asset = self._by_name.get(name)
+        stamp = _get_stamp(self.static_dir / name)
+        if stamp is None:
+            return None
+        if asset is None or asset.stamp != stamp:
+            asset = self._add(name)
+        return asset
+
+    def _add(self, name: str) -> Optional[StaticAsset]:
+        path = self.static_dir / name
+        stamp = _get_stamp(path)
+        if stamp is None:
+            return None
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        asset = StaticAsset(name, path, digest, stamp)
+        if (
+            asset.mimetype.startswith(_COMPRESSIBLE_TYPES)
+            and len(content) >= defs.STATIC_COMPRESS_MIN_SIZE
+        ):
+            self._precompress(asset, content)
+        old = self._by_name.get(name)
+        if old is not None:
+            self._by_fingerprint.pop(old.fingerprinted, None)
+        self._by_name[name] = asset
+        self._by_fingerprint[asset.fingerprinted] = asset
+        return asset
+
+    def _precompress(self, asset: StaticAsset, content: bytes):
+        ''' Write compressed variants once per content hash, keep only useful ones '''
+        for encoding, suffix in _ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            target = self.cache_dir / f'{asset.fingerprinted}{suffix}'
+            if not target.is_file():
+                if encoding == 'br':
+                    data = brotli.compress(content)
+                else:
+                    data = gzip.compress(content, compresslevel=9, mtime=0)
+                if len(data) >= len(content):
+                    continue
+                try:
+                    os.makedirs(target.parent, exist_ok=True)
+                    tmp_path = target.with_name(f'.{target.name}.{os.getpid()}')
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, target)
+                except OSError as e:
+                    syslog.msg(f'Unable to write precompressed asset {target}: {e}')
+                    continue
+            asset.encoded[encoding] = target
+
+    def negotiate(self, asset: StaticAsset, accept_encodings) -> Optional[str]:
+        ''' Best available precompressed encoding the client accepts, or None '''
+        for encoding, _suffix in _ENCODINGS:
+            if encoding in asset.encoded and accept_encodings[encoding]:
+                return encoding
+        return None
+
+
+def _get_stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
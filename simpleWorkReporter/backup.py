@@ -0,0 +1,115 @@
+'''
+simpleWorkReporter - backup.py
+--
+Online task database backups through the sqlite3 backup API.  Pages are
+copied defs.BACKUP_PAGES_PER_STEP at a time with a short sleep between
+steps, so the service keeps reading and writing while a backup runs; a
+write part way through simply restarts the copy, and the result is always
+a consistent snapshot.  Backups are checked with PRAGMA quick_check,
+optionally gzip compressed, and rotated to keep the newest few.
+'''
+from . import defs
+from . import syslog
+from .tasks import TaskDatabase
+from .errors import *
+
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+
+
+def _copy_database(db_path: Path, target_path: Path):
+    ''' Step-wise sqlite backup of db_path into a new file at target_path '''
+    def progress(status, remaining, total):
+        syslog.dbg(f'Backup of {db_path}: {total - remaining} of {total} pages copied')
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(
+            target,
+            pages=defs.BACKUP_PAGES_PER_STEP,
+            progress=progress,
+            sleep=defs.BACKUP_STEP_SLEEP
+        )
+        result = target.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            raise swrDatabaseError(f'Backup of {db_path} failed verification: {result}')
+    except sqlite3.DatabaseError as e:
+        raise swrDatabaseError(f'Backup of {db_path} failed: {e}')
+    finally:
+        target.close()
+        source.close()
+
+
+def write_backup(task_db: TaskDatabase, out: BinaryIO, compress: bool = True):
+    ''' Write a consistent snapshot of the task DB to the binary file out '''
+    with tempfile.TemporaryDirectory(prefix='.swr-backup-') as tmp_dir:
+        snapshot = Path(tmp_dir) / 'snapshot.db'
+        _copy_database(task_db.db_path, snapshot)
+        with open(snapshot, 'rb') as f:
+            if compress:
+                with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as gz:
+                    shutil.copyfileobj(f, gz, 1024 * 1024)
+            else:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+
+
+def get_backup_name(task_db: TaskDatabase, compress: bool = True) -> str:
+    stem = Path(task_db.db_path).stem
+    suffix = '.db.gz' if compress else '.db'
+    return f'{stem}-{datetime.now():%Y%m%d-%H%M%S}{suffix}'
+
+
+def backup_database(
+    task_db: TaskDatabase, backup_dir: Path = None,
+    compress: bool = True, keep: int = None
+) -> Path:
+    '''
+    Back up the task DB into backup_dir (default defs.BACKUP_DIR), then
+    remove all but the newest keep backups of it.  Returns the new file.
+    '''
+    backup_dir = Path(backup_dir or defs.BACKUP_DIR)
+    os.makedirs(backup_dir, exist_ok=True)
+    target = backup_dir / get_backup_name(task_db, compress)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{target.name}.', dir=backup_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_backup(task_db, f, compress)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    syslog.msg(f'Backed up {task_db.db_path} to {target} ({target.stat().st_size} bytes)')
+    rotate_backups(task_db, backup_dir, keep)
+    return target
+
+
+def rotate_backups(task_db: TaskDatabase, backup_dir: Path = None, keep: int = None) -> list:
+    ''' Delete all but the newest keep backups of the task DB.  Returns the removed paths '''
+    backup_dir = Path(backup_dir or defs.BACKUP_DIR)
+    if keep is None:
+        keep = int(defs.OPTIONAL_CONF_VALUES['Backup_Keep']['default'])
+    if keep <= 0:
+        return []
+    stem = Path(task_db.db_path).stem
+    # Names sort by their timestamp
+    backups = sorted(
+        path for path in backup_dir.glob(f'{stem}-*.db*')
+        if path.name.endswith(('.db', '.db.gz'))
+    )
+    removed = backups[:-keep]
+    for path in removed:
+        try:
+            path.unlink()
+        except OSError as e:
+            syslog.msg(f'Unable to remove old backup {path}: {e}')
+    return removed
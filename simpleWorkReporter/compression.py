@@ -0,0 +1,107 @@
+'''
+simpleWorkReporter - compression.py
+--
+Negotiated response compression for the web service.  HTML and other text
+responses are compressed with brotli (when the module is installed), gzip
+or deflate depending on the client's Accept-Encoding.  Buffered responses
+below defs.COMPRESS_MIN_SIZE are sent as-is; streamed responses are
+compressed chunk by chunk and flushed so the client still receives data
+progressively.
+'''
+from . import defs
+
+from typing import Iterable, Iterator, Optional
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in server preference order
+_ENCODINGS = ('br', 'gzip', 'deflate')
+
+
+class _Compressor():
+    ''' Common incremental interface over zlib and brotli compressors '''
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=min(level, 11))
+        else:
+            # gzip container for gzip, zlib container for HTTP "deflate"
+            wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        ''' Emit everything compressed so far without ending the stream '''
+        if self.encoding == 'br':
+            return self._obj.flush()
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    ''' Best supported encoding the client accepts, or None for identity '''
+    for encoding in _ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def _compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    compressor = _Compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response, accept_encodings):
+    '''
+    after_request hook - compress eligible responses in place and return them
+    '''
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in defs.COMPRESS_MIMETYPES
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(
+            response.response, encoding, defs.COMPRESS_LEVEL
+        )
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < defs.COMPRESS_MIN_SIZE:
+            return response
+        compressor = _Compressor(encoding, defs.COMPRESS_LEVEL)
+        response.set_data(compressor.compress(data) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -10,8 +10,11 @@ from .errors import *
 
 
 from pathlib import Path
+from collections.abc import Mapping
 import os
 import hashlib
+import shutil
+import tempfile
 from enum import Enum, auto
 from typing import Tuple, Optional
 from datetime import datetime
@@ -23,49 +26,101 @@ class UpdateResult(Enum):
     FAILURE = auto()
 
 
+class SettingsSnapshot(Mapping):
+    '''
+    Immutable snapshot of the loaded configuration values.  Shared by the
+    routes, templates and mailer; supports both settings['key'] and
+    settings.key access.  stamp holds the config file state it was loaded from.
+    '''
+    __slots__ = ('_values', 'stamp')
+
+    def __init__(self, values: dict, stamp: tuple = None):
+        object.__setattr__(self, '_values', dict(values))
+        object.__setattr__(self, 'stamp', stamp)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(f'Unknown configuration setting: {name!r}') from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SettingsSnapshot is immutable')
+
+    def __repr__(self):
+        return f'SettingsSnapshot(config_path={self._values.get("config_path")!r})'
+
+
 class LoadSwrSettings:
     ''' 
     simpleWorkReporter Configuration Structure
     Init attempts to load configuration file 'worker.conf' from the subdirectory
     of the package by default.
     Specifying a specific config_path Path will load an alternative config file.
+
+    Values are held in an immutable SettingsSnapshot which refresh() only
+    replaces when the config file's mtime or size has changed.
     '''
     def __init__(self, config_path: Path = None):
-        config_values = _load_config(config_path)
-        try:
-            self.service_port = config_values['service_port']
-            self.worker_name = config_values['worker_name']
-            self.worker_email = config_values['worker_email']
-            self.manager_name = config_values['manager_name']
-            self.manager_email = config_values['manager_email']
-            self.smtp = config_values['smtp']
-            self.access = config_values.get('access')
-            self.config_path = config_values['config_path']
-            syslog.dbg(f'Loaded configuration values:\n{syslog.jdump(dict(self))}')
-        except KeyError as e:
-            msg = f'Configuration missing required value: \'{str(e.args[0]).upper()}\''
-            raise swrConfigError(msg) from None
+        self.config_path = str(config_path or defs.CONFIG_FILE_PATH)
+        self._snapshot = None
+        self._failed_stamp = None
+        self._snapshot = _load_settings_snapshot(self.config_path)
+        syslog.dbg(f'Loaded configuration values:\n{syslog.jdump(dict(self))}')
 
     def __repr__(self):
         return f'LoadSwrSettings(config_path={self.config_path!r})'
     
     def __str__(self):
-        return (
-            f'LoadSwrSettings(service_port={self.service_port!r}, '
-            f'worker_name={self.worker_name!r}, worker_email={self.worker_email!r}, '
-            f'manager_name={self.manager_name!r}, manager_email={self.manager_email!r}, '
-            f'smtp={self.smtp!r}, access={self.access!r}, config_path={self.config_path!r})'
-        )
+        values = ', '.join(f'{k}={v!r}' for k, v in self._snapshot.items())
+        return f'LoadSwrSettings({values})'
     
     def __iter__(self):
-        yield ("service_port", self.service_port)
-        yield ("worker_name", self.worker_name)
-        yield ("worker_email", self.worker_email)
-        yield ("manager_name", self.manager_name)
-        yield ("manager_email", self.manager_email)
-        yield ("smtp", self.smtp)
-        yield ("access", self.access)
-        yield ("config_path", self.config_path)
+        return iter(self._snapshot.items())
+
+    def __getattr__(self, name):
+        ''' Setting values (service_port, worker_name, ...) come from the snapshot '''
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._snapshot[name]
+        except KeyError:
+            raise AttributeError(f'Unknown configuration setting: {name!r}') from None
+
+    @property
+    def snapshot(self) -> SettingsSnapshot:
+        ''' Current immutable settings snapshot '''
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        '''
+        Reload the configuration if the file changed on disk since the current
+        snapshot was taken.  A file that fails to load keeps the previous
+        snapshot in place.  Returns True if a new snapshot was loaded.
+        '''
+        stamp = _get_config_stamp(self.config_path)
+        if stamp == self._snapshot.stamp or stamp == self._failed_stamp:
+            return False
+        try:
+            self._snapshot = _load_settings_snapshot(self.config_path)
+        except swrConfigError as e:
+            self._failed_stamp = stamp
+            syslog.msg(f'Configuration reload failed, keeping previous values: {e}')
+            return False
+        self._failed_stamp = None
+        syslog.dbg(f'Reloaded configuration from {self.config_path}')
+        return True
 
     def is_pass_valid(self, password: str) -> bool:
         ''' Validate that supplied password hash matches access key '''
@@ -91,19 +146,21 @@ class LoadSwrSettings:
         Class internal wrapper to general config file update with additional
         logic to handle instantiated class change components
         '''
-        update_config(self.config_path, service_port, 
-            worker_name, worker_email, manager_name, manager_email, 
-            smtp, access)
+        try:
+            update_config(self.config_path, service_port, 
+                worker_name, worker_email, manager_name, manager_email, 
+                smtp, access)
+        except swrConfigError as e:
+            return (UpdateResult.FAILURE, str(e))
         
         # Check if the service port is being updated
-        new_service_port = not service_port == self.service_port
+        new_service_port = not str(service_port) == str(self.service_port)
         # Reload settings from updated file
-        self.__init__()
+        self.refresh()
         if new_service_port:
             return (UpdateResult.NEW_SERVICE_PORT, None)
         else:
             return (UpdateResult.UPDATED, None)
-        return (UpdateResult.FAILURE, error_message)
 
         
 
@@ -157,21 +214,75 @@ def update_config(config_path: Path, service_port: int,
         updated_config_lines.append(line)
     
     try:    
-        with open(config_path,'w') as f:
-            bytes_written = f.write('\n'.join(updated_config_lines) + '\n')
-            syslog.dbg(
-                f'Configuration updates written to {config_path} '
-                f'({bytes_written} bytes)'
-            )
-    except Exception:
+        bytes_written = _write_config_file(
+            config_path, '\n'.join(updated_config_lines) + '\n'
+        )
+        syslog.dbg(
+            f'Configuration updates written to {config_path} '
+            f'({bytes_written} bytes)'
+        )
+    except OSError as e:
         error_message = (
             f'Configuration update to {config_path} failed -- '
-            f'{e.__name__} - {str(e)}'
+            f'{type(e).__name__} - {str(e)}'
         )
         syslog.dbg(error_message)
+        raise swrConfigError(error_message) from None
     return True
 
 
+def _write_config_file(config_path: Path, content: str) -> int:
+    '''
+    Atomically replace the config file contents by writing a temp file in
+    the same directory and renaming it over the original.  Readers never see
+    a partially written file.  Returns the number of characters written.
+    '''
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(config_path)}.', dir=config_dir)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            bytes_written = f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.isfile(config_path):
+            shutil.copymode(config_path, tmp_path)
+        os.replace(tmp_path, config_path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    return bytes_written
+
+
+def _get_config_stamp(config_path: Path) -> Optional[tuple]:
+    ''' Returns the (mtime_ns, size, inode) of the config file, or None if missing '''
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _load_settings_snapshot(config_path: Path) -> SettingsSnapshot:
+    '''
+    Load the config file into a SettingsSnapshot holding the required and
+    optional settings (with defaults for missing optional keys).
+    '''
+    stamp = _get_config_stamp(config_path)
+    config_values = _load_config(config_path)
+    values = {}
+    try:
+        for key in defs.REQUIRED_CONF_VALUES:
+            values[key.lower()] = config_values[key.lower()]
+    except KeyError as e:
+        msg = f'Configuration missing required value: \'{str(e.args[0]).upper()}\''
+        raise swrConfigError(msg) from None
+    for key, details in getattr(defs, 'OPTIONAL_CONF_VALUES', {}).items():
+        values[key.lower()] = config_values.get(key.lower(), details['default'])
+    values['config_path'] = config_values['config_path']
+    return SettingsSnapshot(values, stamp)
+
+
 def _is_config_key(line: str, settings: dict) -> bool:
     ''' 
     Parses line for a configuration key and returns
@@ -298,8 +409,7 @@ def create_config_file(config_path: Path, settings: dict):
             config_lines.append(f'')
         except KeyError as e:
             raise swrConfigError(f'Missing settings value for {setting}')
-    with open(config_path,'w') as f:
-        bytes_written = f.write("\n".join(config_lines) + "\n")
-        syslog.dbg(f'Wrote {bytes_written} bytes to config file: {config_path}')
+    bytes_written = _write_config_file(config_path, "\n".join(config_lines) + "\n")
+    syslog.dbg(f'Wrote {bytes_written} bytes to config file: {config_path}')
 
 
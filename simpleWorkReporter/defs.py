@@ -17,6 +17,18 @@ PACKAGE_NAME = "simpleWorkReporter"
 #   %date_range% - Date ranges included in report
 EMAIL_SUBJECT = "Work Summary Report for %worker_name% : %date_range%"
 
+# Manager digest (sendDigest.py) subject line
+#   %manager_name% - Manager Name shared by the digest's workers
+#   %date_range% - Date ranges included across all workers
+DIGEST_EMAIL_SUBJECT = "Work Summary Digest for %manager_name% : %date_range%"
+# Digest From address, empty to send as PACKAGE_NAME@<service host>
+DIGEST_SEND_FROM = ""
+# Worker sections of a digest are rendered concurrently by this many threads
+DIGEST_RENDER_THREADS = 4
+
+# Rendered reports are buffered in memory up to this size, then spill to disk
+REPORT_SPOOL_MEMORY = 1024 * 1024
+
 # DEBUG - Set to any value to enable debugging messages
 DEBUG = None
 
@@ -27,20 +39,77 @@ DEFAULT_TASK_TIME = '12:00:01'
 # Default directory for app data is ../ tracked from these modules
 DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent
 
+# Jinja2 template directory and the on-disk compiled template cache shared
+# by the web service and the sendReport.py script
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+JINJA_CACHE_DIR = DEFAULT_DATA_DIR / '.jinja_cache'
+
+# Static assets are served under fingerprinted URLs from /assets/ with a
+# long-lived immutable cache lifetime.  Precompressed copies live in the cache.
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+STATIC_CACHE_DIR = DEFAULT_DATA_DIR / '.static_cache'
+STATIC_MAX_AGE = 31536000
+STATIC_COMPRESS_MIN_SIZE = 256
+
+# Dynamic response compression (gzip/deflate, brotli if installed)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = (
+    'text/html', 'text/plain', 'text/css',
+    'application/json', 'application/javascript'
+)
+
 # Web Server SSL Certificate Files
 SSL_KEY_FILE  = DEFAULT_DATA_DIR / 'key.pem'
 SSL_CERT_FILE = DEFAULT_DATA_DIR / 'cert.pem'
 
+# Self-signed certificate key type: 'ecdsa' (P-256), 'ed25519' or 'rsa' (4096)
+#   ECDSA keys generate instantly and make handshakes far cheaper than RSA-4096.
+#   Ed25519 is faster still but not accepted by most browsers for TLS yet.
+SSL_KEY_TYPES = ('ecdsa', 'ed25519', 'rsa')
+SSL_KEY_TYPE = 'ecdsa'
+
+# TLS 1.2 cipher suites offered by the web server (TLS 1.3 suites are fixed
+# by OpenSSL).  Forward secret AEAD suites only.
+SSL_CIPHERS = 'ECDHE+AESGCM:ECDHE+CHACHA20:!aNULL:!MD5:!DSS'
+
 # System console output and logging Defaults
 LOG_APP_NAME  = 'simpleWorkReporter'
 LOG_FILE_NAME = 'swr_service.log'
 LOG_FILE_PATH = DEFAULT_DATA_DIR / LOG_FILE_NAME
 LOG_CONSOLE_ONLY = False
+# The log file is rotated at LOG_MAX_BYTES or every LOG_MAX_AGE seconds, and
+# the newest LOG_KEEP gzip compressed segments are kept.  worker.conf can
+# override these with Log_Max_Bytes, Log_Rotate_Hours and Log_Keep.
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_MAX_AGE = 86400
+LOG_KEEP = 7
+
+# Span tracing (trace.py, --trace) - written to TRACE_FILE_PATH + .jsonl or
+# .json (chrome format), rotated at TRACE_MAX_BYTES keeping TRACE_KEEP files
+TRACE_FILE_PATH = DEFAULT_DATA_DIR / 'swr_trace'
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_KEEP = 3
+
+# Service hostname (report footer) lookups are cached for this many seconds
+HOSTNAME_CACHE_TTL = 3600
+
+# Built-in report scheduler job state/lock files
+SCHEDULE_STATE_DIR = DEFAULT_DATA_DIR / '.schedule'
 
 # Configuration File Defaults
 CONFIG_FILE_NAME = 'worker.conf'
 CONFIG_FILE_PATH = DEFAULT_DATA_DIR / CONFIG_FILE_NAME
 
+# Team mode - one service hosting many workers, each with its own
+# worker.conf and tasks.db shard in TEAM_DIR/<worker_id>/.  At most
+# TEAM_CACHE_SIZE workers are kept loaded, least recently used first out.
+TEAM_DIR = DEFAULT_DATA_DIR / 'team'
+TEAM_CACHE_SIZE = 32
+TEAM_WORKER_ID_PATTERN = r'[a-z0-9][a-z0-9_.-]{0,63}'
+TEAM_SECRET_KEY_FILE = '.secret_key'
+TEAM_SERVICE_PORT = 8443
+
 # Task Database File Definitions
 TASKDB_FILE_NAME = 'tasks.db'
 TASKDB_FILE_PATH = DEFAULT_DATA_DIR / TASKDB_FILE_NAME
@@ -57,9 +126,160 @@ TASKDB_TABLESQL = f'''
     );
 '''
 
+# Sent report history - rendered bodies are stored zlib compressed
+TASKDB_REPORT_TABLE = 'swr_reports'
+TASKDB_REPORT_TABLESQL = f'''
+    CREATE TABLE IF NOT EXISTS {TASKDB_REPORT_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sent REAL NOT NULL,
+        subject TEXT NOT NULL,
+        recipients TEXT NOT NULL,
+        date_range TEXT NOT NULL,
+        task_ids TEXT NOT NULL,
+        task_count INTEGER NOT NULL,
+        part INTEGER NOT NULL DEFAULT 1,
+        part_count INTEGER NOT NULL DEFAULT 1,
+        body_size INTEGER NOT NULL,
+        body BLOB NOT NULL
+    );
+'''
+
+# Task change events - the event id doubles as a change counter that lets
+# the web service see writes made by other processes (sendReport.py)
+TASKDB_EVENT_TABLE = 'swr_events'
+TASKDB_EVENT_TABLESQL = f'''
+    CREATE TABLE IF NOT EXISTS {TASKDB_EVENT_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        task_ids TEXT NOT NULL,
+        timestamp REAL NOT NULL
+    );
+'''
+# Number of most recent change events kept in the table
+TASKDB_EVENT_RETENTION = 1000
+
+# Named leases (advisory locks with expiry) shared by every process using
+# the task DB - the report send lease keeps the web service, the scheduler
+# and sendReport.py from sending the same tasks concurrently
+TASKDB_LOCK_TABLE = 'swr_locks'
+TASKDB_LOCK_TABLESQL = f'''
+    CREATE TABLE IF NOT EXISTS {TASKDB_LOCK_TABLE} (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        acquired REAL NOT NULL,
+        expires REAL NOT NULL
+    );
+'''
+SEND_LEASE_NAME = 'send_report'
+# Seconds a send lease is held before another sender may take it over, the
+# holder renews it after each report part.  Must outlast one SMTP exchange
+SEND_LEASE_SECONDS = 300
+
+# Task DB storage tuning profiles, chosen with the Storage_Profile setting.
+# journal_mode is stored in the database file and set once, the others are
+# applied to every connection.  cache_size is in KiB when negative, mmap_size
+# in bytes.  Measured throughput is in the README (devel/storage_bench.py).
+#   durable  - WAL, fsync on every commit.  Survives power loss
+#   balanced - WAL, fsync at checkpoints.  A power cut may lose the last
+#              few commits, an application crash loses nothing
+#   fast     - no fsync at all.  A power cut may corrupt the database
+TASKDB_STORAGE_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8192,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -32768,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+# Slow query log (querylog.py) - task DB statements taking SLOW_QUERY_MS or
+# longer are logged to SLOW_QUERY_LOG_PATH with their query plan, as are
+# statements whose plan scans a whole table.  worker.conf Slow_Query_Ms
+# overrides the threshold, 0 disables the log.
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_PATH = DEFAULT_DATA_DIR / 'swr_slow_queries.log'
+
+# Online task DB backups (backup.py / backupDB.py).  The sqlite backup API
+# copies BACKUP_PAGES_PER_STEP pages at a time, sleeping BACKUP_STEP_SLEEP
+# seconds between steps so the service's writers are never held up.
+BACKUP_DIR = DEFAULT_DATA_DIR / 'backups'
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+
+# Task DB maintenance (maintenance.py / maintainDB.py)
+#   Runs at most once per MAINTENANCE_INTERVAL seconds per DB, inside the
+#   service only after MAINTENANCE_IDLE seconds without a request (checked
+#   every MAINTENANCE_CHECK_INTERVAL).  A run stops after MAINTENANCE_BUDGET
+#   seconds and is retried MAINTENANCE_RETRY seconds later if cut short.
+MAINTENANCE_LEASE_NAME = 'maintenance'
+MAINTENANCE_INTERVAL = 24 * 3600
+MAINTENANCE_RETRY = 3600
+MAINTENANCE_IDLE = 300
+MAINTENANCE_CHECK_INTERVAL = 60
+MAINTENANCE_BUDGET = 2.0
+# Seconds to wait on a locked DB before a maintenance step gives up
+MAINTENANCE_BUSY_TIMEOUT = 0.25
+# Rows sampled per index by ANALYZE (PRAGMA analysis_limit)
+MAINTENANCE_ANALYSIS_LIMIT = 1000
+
+# Schema statements applied (idempotently) every time a task DB is opened
+#   Used to add tables/indexes to databases created by older versions
+# Task list filter/facet indexes - the sent state (unsent list and count),
+# type and sub type facets with their filters, and date ranges.  The type
+# index covers the facet counts so they never read the task rows.
+TASKDB_TASK_INDEXSQL = [
+    f'CREATE INDEX IF NOT EXISTS idx_{TASKDB_TASK_TABLE}_sent '
+    f'ON {TASKDB_TASK_TABLE} (sent, timestamp)',
+    f'CREATE INDEX IF NOT EXISTS idx_{TASKDB_TASK_TABLE}_type '
+    f'ON {TASKDB_TASK_TABLE} (taskType, taskSubType, sent, timestamp)',
+    f'CREATE INDEX IF NOT EXISTS idx_{TASKDB_TASK_TABLE}_timestamp '
+    f'ON {TASKDB_TASK_TABLE} (timestamp)',
+]
+# Type and sub type values listed per facet on the all tasks page, and the
+# most tasks listed at once (newest first)
+TASK_FACET_LIMIT = 20
+TASK_LIST_LIMIT = 500
+
+TASKDB_SCHEMA_UPDATES = [
+    TASKDB_REPORT_TABLESQL,
+    TASKDB_EVENT_TABLESQL,
+    TASKDB_LOCK_TABLESQL,
+    *TASKDB_TASK_INDEXSQL,
+]
+
+# Server-Sent Events (live page updates) - seconds between change counter
+# checks for writes from other processes, and between keepalive comments
+SSE_POLL_INTERVAL = 2
+SSE_KEEPALIVE_INTERVAL = 15
+
+# Request header set by the page scripts when submitting through fetch(),
+# asks for an HTML fragment in place of the redirect to the full page
+FRAGMENT_REQUEST_HEADER = 'X-SWR-Fragment'
+
 # Endpoint routes allowed without authentication
 ALLOWED_ENDPOINTS_WITHOUT_AUTH = ['www_login', 'www_logout', 'www_restart']
 
+# URL path prefixes for static content (no auth or restart redirects)
+STATIC_URL_PREFIXES = ('/static/', '/assets/')
+
 
 # Required CONF_FILE keys for simpleWorkReporter configuration
 #   Primarily used for building new configuration via setup
@@ -113,3 +333,92 @@ REQUIRED_CONF_VALUES = {
         ]
     }
 }
+
+
+# Optional CONF_FILE keys for simpleWorkReporter configuration
+#   Default values are used when the key is not present in the config file
+OPTIONAL_CONF_VALUES = {
+    'Service_Host': {
+        'default': '',
+        'desc': [
+            'Service_Host overrides the hostname shown in the report footer.',
+            '  Leave empty to look up the fully qualified hostname automatically.'
+        ]
+    },
+    'Report_Schedule': {
+        'default': '',
+        'desc': [
+            'Report_Schedule sends the report from the running service using cron',
+            '  style "minute hour day month weekday" entries separated by ";".',
+            '  e.g. "30 16 * * 1-5" for 4:30pm on weekdays.  Empty disables it.'
+        ]
+    },
+    'Report_Max_Rows': {
+        'default': '500',
+        'desc': [
+            'Report_Max_Rows splits reports with more tasks than this into',
+            '  multiple numbered emails by date range.  0 disables the limit.'
+        ]
+    },
+    'Report_Max_Bytes': {
+        'default': '5000000',
+        'desc': [
+            'Report_Max_Bytes splits reports whose rendered HTML is larger than',
+            '  this into multiple numbered emails.  0 disables the limit.'
+        ]
+    },
+    'Storage_Profile': {
+        'default': 'durable',
+        'desc': [
+            'Storage_Profile tunes the task database: durable, balanced or fast.',
+            '  balanced and fast trade crash safety for fewer disk syncs.'
+        ]
+    },
+    'Slow_Query_Ms': {
+        'default': str(SLOW_QUERY_MS),
+        'desc': [
+            'Slow_Query_Ms logs task database statements slower than this many',
+            '  milliseconds to swr_slow_queries.log.  0 disables the log.'
+        ]
+    },
+    'Backup_Schedule': {
+        'default': '',
+        'desc': [
+            'Backup_Schedule backs up the task database from the running service,',
+            '  same format as Report_Schedule.  Empty disables it.'
+        ]
+    },
+    'Backup_Keep': {
+        'default': '7',
+        'desc': [
+            'Backup_Keep is the number of most recent task database backups kept.'
+        ]
+    },
+    'Log_Max_Bytes': {
+        'default': str(LOG_MAX_BYTES),
+        'desc': [
+            'Log_Max_Bytes rotates the service log once it reaches this size.',
+            '  0 disables size based rotation.'
+        ]
+    },
+    'Log_Rotate_Hours': {
+        'default': str(LOG_MAX_AGE // 3600),
+        'desc': [
+            'Log_Rotate_Hours starts a new service log every this many hours.',
+            '  0 disables time based rotation.'
+        ]
+    },
+    'Log_Keep': {
+        'default': str(LOG_KEEP),
+        'desc': [
+            'Log_Keep is the number of compressed rotated service logs kept.'
+        ]
+    },
+    'Schedule_Catchup_Hours': {
+        'default': '12',
+        'desc': [
+            'Schedule_Catchup_Hours is how late a missed scheduled send (service',
+            '  down at the scheduled time) may still be sent once on startup.'
+        ]
+    }
+}
@@ -1,23 +1,19 @@
 '''
 dependencies check and graceful missing module recommendations for anything
 modules that are not part of a standard base python installation.
+
+Modules are only looked up (find_spec), not imported - cryptography is only
+needed by setupService.py and loading it here would slow every startup.
 '''
-errors = ''
-try:
-    from flask import __file__ as _flask_file
-except ModuleNotFoundError:
-    errors += (
-        f'MISSING: "flask" module failed to import, do you need to install it?\n'
-        f' python3 -m pip install flask\n'
-    )
+from importlib.util import find_spec
 
-try:
-    from cryptography import __file__ as _cryptography_file
-except ModuleNotFoundError:
-    errors += (
-        f'MISSING: "cryptography" module failed to import, do you need to install it?\n'
-        f' python3 -m pip install cryptography\n'
-    )
+errors = ''
+for module in ('flask', 'cryptography'):
+    if find_spec(module) is None:
+        errors += (
+            f'MISSING: "{module}" module failed to import, do you need to install it?\n'
+            f' python3 -m pip install {module}\n'
+        )
 
 if errors:
     print(errors + '\n')
@@ -0,0 +1,260 @@
+'''
+simpleWorkReporter - digest.py
+--
+Manager digest rollup.  Collects the unsent tasks of many team workers
+(see team.py), renders each worker's _report_body.html section in a thread
+pool and sends each manager one combined email.  All digests for the same
+SMTP server go out over a single SMTP session.
+
+Every included worker's send lease is held for the duration, so a worker's
+own sendReport.py or web send can't report the same tasks at the same time.
+The leases are renewed before each SMTP session, and a worker whose lease
+was taken over in the meantime is dropped from the digest.
+Each worker's report history gets a digest of its own section only, so a
+stored report never shows or resends another worker's tasks.
+'''
+from . import defs
+from . import syslog
+from . import mailer
+from . import render
+from . import team
+from .report import get_full_hostname
+from .tasks import _get_date_range, _get_lease_owner
+
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formataddr
+from jinja2 import Environment
+from markupsafe import Markup
+from pathlib import Path
+from typing import BinaryIO
+import tempfile
+
+
+class DigestSection():
+    ''' One worker's part of a manager digest '''
+    def __init__(self, worker: team.WorkerContext, tasks: list):
+        self.worker = worker
+        self.settings = worker.settings.snapshot
+        self.tasks = tasks
+        self.date_range = _get_date_range(tasks)
+        self.body = None
+
+    def __repr__(self):
+        return f'DigestSection(worker={self.worker.worker_id!r}, tasks={len(self.tasks)})'
+
+
+class ManagerDigest():
+    ''' Sections addressed to one manager, rendered into a single email '''
+    def __init__(self, manager_name: str, manager_email: str, smtp: str):
+        self.manager_name = manager_name
+        self.manager_email = manager_email
+        self.smtp = smtp
+        self.sections = []
+        self.body = None
+
+    @property
+    def tasks(self) -> list:
+        return [task for section in self.sections for task in section.tasks]
+
+    @property
+    def send_from(self) -> str:
+        if defs.DIGEST_SEND_FROM:
+            return defs.DIGEST_SEND_FROM
+        return formataddr((defs.PACKAGE_NAME, f'{defs.PACKAGE_NAME}@{get_full_hostname()}'))
+
+    @property
+    def send_to(self) -> list:
+        return [formataddr((self.manager_name, self.manager_email))]
+
+    @property
+    def subject(self) -> str:
+        return mailer._get_digest_subject(self.manager_name, _get_date_range(self.tasks))
+
+
+def _render_section(section: DigestSection, service_host: str, env: Environment):
+    ''' Thread pool job - render one worker's section, kept as Markup '''
+    body = env.get_template('_report_body.html').render(
+        settings=section.settings,
+        date_range=section.date_range,
+        tasks=section.tasks,
+        service_host=service_host
+    )
+    section.body = Markup(body)
+
+
+def collect_digests(registry: team.WorkerRegistry, worker_ids: list, owner: str) -> list:
+    '''
+    Group the workers' unsent tasks into ManagerDigests, keyed by manager
+    email and SMTP server.  Takes each included worker's send lease; workers
+    whose lease is held elsewhere, or with nothing to send, are skipped.
+    The leases taken so far are released again if collecting fails.
+    '''
+    digests = {}
+    leased = []
+    try:
+        for worker_id in worker_ids:
+            worker = registry.find(worker_id)
+            if worker is None:
+                continue
+            result, holder = worker.task_db.acquire_lease(
+                defs.SEND_LEASE_NAME, owner, defs.SEND_LEASE_SECONDS
+            )
+            if not result:
+                syslog.msg(f'Digest skipping {worker_id}, send in progress by {holder["owner"]}')
+                continue
+            leased.append(worker.task_db)
+            tasks = worker.task_db.get_unsent_tasks()
+            if not tasks:
+                leased.pop().release_lease(defs.SEND_LEASE_NAME, owner)
+                continue
+            settings = worker.settings.snapshot
+            key = (settings['manager_email'].lower(), settings['smtp'])
+            if key not in digests:
+                digests[key] = ManagerDigest(
+                    settings['manager_name'], settings['manager_email'], settings['smtp']
+                )
+            digests[key].sections.append(DigestSection(worker, tasks))
+    except BaseException:
+        for task_db in leased:
+            task_db.release_lease(defs.SEND_LEASE_NAME, owner)
+        raise
+    return list(digests.values())
+
+
+def _render_digest(manager_name: str, sections: list, env: Environment) -> BinaryIO:
+    ''' digest.html of already rendered sections into a spooled buffer at position 0 '''
+    tasks = [task for section in sections for task in section.tasks]
+    body = tempfile.SpooledTemporaryFile(max_size=defs.REPORT_SPOOL_MEMORY)
+    for chunk in env.get_template('digest.html').generate(
+        manager_name=manager_name,
+        sections=[section.body for section in sections],
+        task_count=len(tasks),
+        date_range=_get_date_range(tasks)
+    ):
+        body.write(chunk.encode('utf-8'))
+    body.seek(0)
+    return body
+
+
+def render_digests(digests: list, service_host: str, env: Environment = None):
+    '''
+    Render every section concurrently, then each digest's digest.html into
+    a spooled buffer (ManagerDigest.body)
+    '''
+    env = env or render.get_environment()
+    sections = [section for digest in digests for section in digest.sections]
+    with ThreadPoolExecutor(max_workers=defs.DIGEST_RENDER_THREADS) as pool:
+        # list() re-raises the first rendering error, if any
+        list(pool.map(lambda s: _render_section(s, service_host, env), sections))
+    for digest in digests:
+        digest.body = _render_digest(digest.manager_name, digest.sections, env)
+
+
+def send_digests(
+    team_dir: Path = None, worker_ids: list = None,
+    env: Environment = None, dry_run: bool = False
+) -> list:
+    '''
+    Build and send the manager digests for worker_ids (default: every team
+    worker).  Sent tasks are marked sent and the digest is recorded in each
+    worker's report history.  dry_run renders without sending or marking.
+    Returns a list of (ManagerDigest, result, message) tuples.
+    '''
+    registry = team.WorkerRegistry(team_dir)
+    worker_ids = worker_ids if worker_ids is not None else team.list_workers(team_dir)
+    env = env or render.get_environment()
+    service_host = get_full_hostname()
+    owner = _get_lease_owner()
+    digests = collect_digests(registry, worker_ids, owner)
+    results = []
+    try:
+        render_digests(digests, service_host, env)
+        if dry_run:
+            return [(digest, True, None) for digest in digests]
+
+        by_smtp = {}
+        for digest in digests:
+            by_smtp.setdefault(digest.smtp, []).append(digest)
+        for smtp, smtp_digests in by_smtp.items():
+            # Earlier SMTP sessions may have outlasted the send leases
+            for digest in list(smtp_digests):
+                if not _renew_leases(digest, owner, env):
+                    smtp_digests.remove(digest)
+                    results.append((digest, False, 'Send leases of every worker were taken over.'))
+            if not smtp_digests:
+                continue
+            sent = mailer.send_emails(smtp, [
+                (digest.send_from, digest.send_to, digest.subject, digest.body)
+                for digest in smtp_digests
+            ])
+            for digest, (result, message) in zip(smtp_digests, sent):
+                if result:
+                    _record_digest(digest, service_host, env)
+                else:
+                    syslog.msg(f'Digest for {digest.manager_email} failed: {message}')
+                results.append((digest, result, message))
+    finally:
+        for digest in digests:
+            if digest.body is not None:
+                digest.body.close()
+            for section in digest.sections:
+                section.worker.task_db.release_lease(defs.SEND_LEASE_NAME, owner)
+    return results
+
+
+def _renew_leases(digest: ManagerDigest, owner: str, env: Environment) -> bool:
+    '''
+    Renew the send lease of each of the digest's workers, dropping workers
+    whose lease another sender holds now (the digest is re-rendered without
+    them).  Returns False if no workers are left.
+    '''
+    kept = []
+    for section in digest.sections:
+        result, holder = section.worker.task_db.acquire_lease(
+            defs.SEND_LEASE_NAME, owner, defs.SEND_LEASE_SECONDS
+        )
+        if result:
+            kept.append(section)
+        else:
+            syslog.msg(
+                f'Digest for {digest.manager_email} dropping {section.worker.worker_id}, '
+                f'send lease taken over by {holder["owner"]}'
+            )
+    if len(kept) != len(digest.sections):
+        digest.sections = kept
+        digest.body.close()
+        digest.body = _render_digest(digest.manager_name, kept, env) if kept else None
+    return bool(kept)
+
+
+def _record_digest(digest: ManagerDigest, service_host: str, env: Environment):
+    '''
+    Mark the digest's tasks sent and store each worker's history a digest
+    of only that worker's section.  Tasks another sender has reported since
+    the digest was collected are left out.
+    '''
+    send_to = ', '.join(digest.send_to)
+    for section in digest.sections:
+        task_db = section.worker.task_db
+        unsent_ids = {task['id'] for task in task_db.get_unsent_tasks()}
+        tasks = [task for task in section.tasks if task['id'] in unsent_ids]
+        if not tasks:
+            syslog.msg(
+                f'Digest for {digest.manager_email} not recorded for '
+                f'{section.worker.worker_id}, its tasks were already sent.'
+            )
+            continue
+        if len(tasks) != len(section.tasks):
+            section.tasks = tasks
+            section.date_range = _get_date_range(tasks)
+            _render_section(section, service_host, env)
+        task_db.set_tasks_as_sent(section.tasks)
+        with _render_digest(digest.manager_name, [section], env) as body:
+            task_db.add_report(
+                mailer._get_digest_subject(digest.manager_name, section.date_range),
+                send_to, section.date_range, section.tasks, body
+            )
+        syslog.msg(
+            f'Digest for {digest.manager_email} sent with {len(section.tasks)} '
+            f'tasks from {section.worker.worker_id}.'
+        )
@@ -1,19 +1,29 @@
 '''
 simpleWorkReporter - mailer.py
 Provides mailer routines for sending work summary reports
+
+Report bodies are streamed to the SMTP server from a file-like buffer as
+base64 encoded lines, so a large report never has to be held in memory as
+a complete MIME message string.
 '''
 
 from . import defs
 from . import syslog
+from . import trace
 
 import smtplib
 import os
+import io
 import time
+import base64
+import email.policy
+from email.message import Message
 from email.utils import formataddr
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union, BinaryIO
 
-from email.mime.text import MIMEText
+# Bytes of body read per chunk - multiple of 57 so base64 lines are 76 chars
+_BODY_CHUNK_SIZE = 57 * 1024
 
 def _get_send_from(settings: dict) -> str:
     return formataddr((settings["worker_name"],settings["worker_email"]))
@@ -24,36 +34,123 @@ def _get_send_to(settings: dict) -> list:
         formataddr((settings["worker_name"],settings["worker_email"]))
     ]
 
-def _get_email_subject(settings: dict, date_range: str) -> str:
+def _get_email_subject(settings: dict, date_range: str,
+                       part: int = 1, part_count: int = 1) -> str:
     subject = defs.EMAIL_SUBJECT
-    return subject.replace(
+    subject = subject.replace(
         "%worker_name%", settings["worker_name"]
     ).replace(
         "%date_range%", date_range
     )
+    if part_count > 1:
+        subject += f' (part {part} of {part_count})'
+    return subject
+
+def _get_digest_subject(manager_name: str, date_range: str) -> str:
+    return defs.DIGEST_EMAIL_SUBJECT.replace(
+        "%manager_name%", manager_name
+    ).replace(
+        "%date_range%", date_range
+    )
+
+def _get_header_bytes(send_from: str, send_to: list, subject: str) -> bytes:
+    ''' MIME headers for a base64 encoded text/html message, CRLF terminated '''
+    header = Message()
+    header['From'] = send_from
+    header['To'] = f'{", ".join(send_to)}'
+    header['Subject'] = subject
+    header['MIME-Version'] = '1.0'
+    header['Content-Type'] = 'text/html; charset="utf-8"'
+    header['Content-Transfer-Encoding'] = 'base64'
+    return header.as_bytes(policy=email.policy.compat32.clone(linesep='\r\n'))
 
-def send_report_email(settings: dict, report_body: str, date_range: str) -> Tuple[bool, Optional[str]]:
-    ''' Email the report '''
-    email = MIMEText(report_body, 'html')
+def _send_streamed(server: smtplib.SMTP, send_from: str, send_to: list,
+                   header: bytes, body: BinaryIO):
+    '''
+    Low level SMTP transaction writing the message body straight from the
+    body file.  base64 lines never start with '.', so no dot-stuffing is
+    needed.  Returns the refused recipients dict, like SMTP.sendmail().
+    '''
+    server.ehlo_or_helo_if_needed()
+    code, response = server.mail(send_from)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, send_from)
+    refused = {}
+    for recipient in send_to:
+        code, response = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+    if len(refused) == len(send_to):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, response = server.docmd('DATA')
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, response)
+    server.send(header)
+    while True:
+        chunk = body.read(_BODY_CHUNK_SIZE)
+        if not chunk:
+            break
+        server.send(base64.encodebytes(chunk).replace(b'\n', b'\r\n'))
+    server.send(b'.\r\n')
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+@trace.traced()
+def send_report_email(settings: dict, report_body: Union[str, BinaryIO], date_range: str,
+                      part: int = 1, part_count: int = 1) -> Tuple[bool, Optional[str]]:
+    '''
+    Email the report.  report_body is the rendered HTML as a string or a
+    binary file object positioned at the start of the UTF-8 encoded HTML.
+    '''
+    if isinstance(report_body, str):
+        report_body = io.BytesIO(report_body.encode('utf-8'))
     SENDFROM = _get_send_from(settings)
     SENDTO = _get_send_to(settings)
-    email['From'] = SENDFROM
-    email['To'] = f'{", ".join(SENDTO)}'
-    email['Subject'] = _get_email_subject(settings,date_range)
+    SUBJECT = _get_email_subject(settings, date_range, part, part_count)
     syslog.msg(
         f'Generating email per the following -- \n'
-        f'\tFrom: {email["From"]}\n'
-        f'\tTo:   {email["To"]}\n'
-        f'\tSbjt: {email["Subject"]}\n'
+        f'\tFrom: {SENDFROM}\n'
+        f'\tTo:   {", ".join(SENDTO)}\n'
+        f'\tSbjt: {SUBJECT}\n'
         f'... via SMTP server {settings["smtp"]}:25'
     )
+    header = _get_header_bytes(SENDFROM, SENDTO, SUBJECT)
     with smtplib.SMTP(settings["smtp"],25) as server:
-        response = server.sendmail(
-            SENDFROM,
-            SENDTO,
-            email.as_string()
-        )
+        response = _send_streamed(server, SENDFROM, SENDTO, header, report_body)
         if response:
             return False, response
         else:
             return True, None
+
+@trace.traced()
+def send_emails(smtp_host: str, messages: list) -> list:
+    '''
+    Send several HTML emails over a single SMTP session.  messages is a list
+    of (send_from, send_to, subject, body) tuples, body as in
+    send_report_email().  Returns a (result, message) tuple per message; a
+    refused message doesn't stop the rest, a dropped connection fails them.
+    '''
+    results = []
+    syslog.msg(f'Sending {len(messages)} emails via SMTP server {smtp_host}:25')
+    try:
+        with smtplib.SMTP(smtp_host, 25) as server:
+            for send_from, send_to, subject, body in messages:
+                if isinstance(body, str):
+                    body = io.BytesIO(body.encode('utf-8'))
+                header = _get_header_bytes(send_from, send_to, subject)
+                try:
+                    refused = _send_streamed(server, send_from, send_to, header, body)
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                    results.append((False, str(e)))
+                    server.rset()
+                    continue
+                results.append((False, refused) if refused else (True, None))
+    except (smtplib.SMTPException, OSError) as e:
+        message = f'{type(e).__name__}: {e}'
+        results.extend([(False, message)] * (len(messages) - len(results)))
+    return results
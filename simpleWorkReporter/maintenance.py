@@ -0,0 +1,213 @@
+'''
+simpleWorkReporter - maintenance.py
+--
+Task database upkeep: PRAGMA optimize, ANALYZE, incremental vacuum (with a
+one time migration of older files to auto_vacuum=INCREMENTAL) and a WAL
+checkpoint.  Each run has a time budget enforced by an sqlite progress
+handler, so a step that runs long is interrupted and rolled back instead
+of holding the database lock while requests wait.
+
+Runs from the maintainDB.py CLI, and from MaintenanceTimer inside the web
+service once it has been idle for a while.  The timer leaves the auto_vacuum
+migration (a full VACUUM, far longer than its idle budget on a large file)
+to maintainDB.py, so it never starves the cheap steps.  The last run is recorded as a
+lease in the task DB (defs.MAINTENANCE_LEASE_NAME) so several processes
+sharing a database don't repeat the work.
+'''
+from . import defs
+from . import syslog
+from .tasks import TaskDatabase, _get_lease_owner
+
+from typing import Callable, Optional
+import sqlite3
+import threading
+import time
+
+# PRAGMA auto_vacuum values
+_AUTO_VACUUM_INCREMENTAL = 2
+
+# Pages freed per PRAGMA incremental_vacuum call
+_VACUUM_CHUNK_PAGES = 256
+
+
+class BudgetExceeded(Exception):
+    ''' Maintenance ran out of its time budget '''
+    pass
+
+
+class _Budget():
+    ''' Deadline shared by the steps of one maintenance run '''
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        if self.remaining() <= 0:
+            raise BudgetExceeded()
+
+    def progress_handler(self) -> int:
+        ''' sqlite progress callback - non-zero interrupts the statement '''
+        return 1 if self.remaining() <= 0 else 0
+
+
+def _migrate_auto_vacuum(conn: sqlite3.Connection, budget: _Budget) -> str:
+    '''
+    Files created before auto_vacuum=INCREMENTAL need one full VACUUM to
+    switch modes.  Skipped (retried next run) if the budget runs out.
+    '''
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode == _AUTO_VACUUM_INCREMENTAL:
+        return 'already incremental'
+    budget.check()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return 'migrated to incremental'
+
+
+def _optimize(conn: sqlite3.Connection, budget: _Budget) -> str:
+    budget.check()
+    conn.execute('PRAGMA optimize')
+    return 'done'
+
+
+def _analyze(conn: sqlite3.Connection, budget: _Budget) -> str:
+    budget.check()
+    # Sampled statistics, bounded cost regardless of table size
+    conn.execute(f'PRAGMA analysis_limit = {defs.MAINTENANCE_ANALYSIS_LIMIT}')
+    conn.execute('ANALYZE')
+    return 'done'
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, budget: _Budget) -> str:
+    ''' Return free pages to the filesystem in chunks until none are left '''
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != _AUTO_VACUUM_INCREMENTAL:
+        return 'skipped, auto_vacuum not incremental'
+    freed = 0
+    while True:
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_pages:
+            break
+        budget.check()
+        conn.execute(f'PRAGMA incremental_vacuum({_VACUUM_CHUNK_PAGES})').fetchall()
+        freed += min(free_pages, _VACUUM_CHUNK_PAGES)
+    return f'{freed} pages freed'
+
+
+def _wal_checkpoint(conn: sqlite3.Connection, budget: _Budget) -> str:
+    if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return 'skipped, not in WAL mode'
+    budget.check()
+    busy, log_pages, checkpointed = conn.execute(
+        'PRAGMA wal_checkpoint(TRUNCATE)'
+    ).fetchone()
+    if busy:
+        return f'partial, {checkpointed} of {log_pages} pages (readers active)'
+    return f'{checkpointed} pages'
+
+
+# (name, step) in run order
+MAINTENANCE_STEPS = (
+    ('auto_vacuum', _migrate_auto_vacuum),
+    ('optimize', _optimize),
+    ('analyze', _analyze),
+    ('incremental_vacuum', _incremental_vacuum),
+    ('wal_checkpoint', _wal_checkpoint),
+)
+
+
+def run_maintenance(
+    task_db: TaskDatabase, budget_seconds: float = None, migrate: bool = True
+) -> dict:
+    '''
+    Run every maintenance step against the task DB within budget_seconds
+    (default defs.MAINTENANCE_BUDGET).  migrate=False skips the auto_vacuum
+    migration.  Returns {step: result text}; steps that were interrupted or
+    never reached report so.
+    '''
+    budget = _Budget(budget_seconds or defs.MAINTENANCE_BUDGET)
+    results = {}
+    # Autocommit - VACUUM can't run inside a transaction, and a short busy
+    # timeout means maintenance gives way to writers instead of queueing
+    conn = sqlite3.connect(
+        task_db.db_path, timeout=defs.MAINTENANCE_BUSY_TIMEOUT, isolation_level=None
+    )
+    try:
+        conn.set_progress_handler(budget.progress_handler, 1000)
+        for name, step in MAINTENANCE_STEPS:
+            if step is _migrate_auto_vacuum and not migrate:
+                results[name] = 'skipped, left to maintainDB.py'
+                continue
+            try:
+                results[name] = step(conn, budget)
+            except BudgetExceeded:
+                results[name] = 'not run, out of time'
+            except sqlite3.OperationalError as e:
+                if 'interrupted' in str(e):
+                    results[name] = 'interrupted, out of time'
+                else:
+                    results[name] = f'failed: {e}'
+    finally:
+        conn.close()
+    syslog.msg(
+        f'Database maintenance of {task_db.db_path}: '
+        + ', '.join(f'{name} {result}' for name, result in results.items())
+    )
+    return results
+
+
+def is_complete(results: dict) -> bool:
+    return not any(
+        result.startswith(('not run', 'interrupted', 'failed'))
+        for result in results.values()
+    )
+
+
+def run_if_due(
+    task_db: TaskDatabase, budget_seconds: float = None, migrate: bool = True
+) -> Optional[dict]:
+    '''
+    Run maintenance unless this DB was maintained within the last
+    defs.MAINTENANCE_INTERVAL seconds (by any process).  Runs cut short by
+    the budget are retried after defs.MAINTENANCE_RETRY seconds.
+    Returns the results, or None if not due.
+    '''
+    # A fresh owner per attempt, so the lease is never simply renewed
+    owner = f'{_get_lease_owner()}:{time.time()}'
+    result, _holder = task_db.acquire_lease(
+        defs.MAINTENANCE_LEASE_NAME, owner, defs.MAINTENANCE_INTERVAL
+    )
+    if not result:
+        return None
+    results = run_maintenance(task_db, budget_seconds, migrate)
+    if not is_complete(results):
+        task_db.acquire_lease(defs.MAINTENANCE_LEASE_NAME, owner, defs.MAINTENANCE_RETRY)
+    return results
+
+
+class MaintenanceTimer(threading.Thread):
+    '''
+    Background thread that runs due maintenance on the service's task
+    databases once no request has arrived for defs.MAINTENANCE_IDLE seconds.
+    db_source returns the task DBs to look after, last_activity the
+    time.monotonic() of the latest request.
+    '''
+    def __init__(self, db_source: Callable[[], list], last_activity: Callable[[], float]):
+        super().__init__(name=f'{defs.PACKAGE_NAME}-maintenance', daemon=True)
+        self.db_source = db_source
+        self.last_activity = last_activity
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(defs.MAINTENANCE_CHECK_INTERVAL):
+            for task_db in self.db_source():
+                if time.monotonic() - self.last_activity() < defs.MAINTENANCE_IDLE:
+                    break
+                try:
+                    run_if_due(task_db, migrate=False)
+                except Exception as e:
+                    syslog.msg(f'Database maintenance of {task_db.db_path} failed: {e}')
@@ -0,0 +1,207 @@
+'''
+simpleWorkReporter - querylog.py
+--
+Slow query log for the task database.  TaskDatabase connections are made
+with ProfiledConnection while the log is enabled, which times every
+statement, including fetching its rows.  Statements slower than the
+threshold (defs.SLOW_QUERY_MS, worker.conf Slow_Query_Ms) are appended to
+defs.SLOW_QUERY_LOG_PATH as JSON lines with their SQL, parameters, duration
+and row count.
+
+The first time each statement shape (the SQL with literals replaced by ?)
+is seen, its EXPLAIN QUERY PLAN is captured and kept.  Plans that scan a
+whole table are logged at once as "full_scan", however fast the statement
+is today, and slow statement entries include their plan.  An unfiltered
+scan that stops at a LIMIT without sorting first (the newest N tasks) reads
+only N rows and isn't counted as a full scan.
+'''
+from . import defs
+
+from datetime import datetime
+from typing import Optional
+import json
+import re
+import sqlite3
+import threading
+import time
+
+_threshold = defs.SLOW_QUERY_MS / 1000
+_log_lock = threading.Lock()
+_plans = {}    # shape -> plan lines
+_shapes = {}   # sql -> shape
+_EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+_LIMIT_RE = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+_WHERE_RE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+
+
+def set_threshold(milliseconds: float):
+    ''' Log statements slower than this, 0 disables the log '''
+    global _threshold
+    _threshold = max(float(milliseconds), 0) / 1000
+
+
+def is_enabled() -> bool:
+    return _threshold > 0
+
+
+def get_shape(sql: str) -> str:
+    ''' Statement with whitespace collapsed and literals replaced by ? '''
+    shape = _shapes.get(sql)
+    if shape is None:
+        shape = _LITERAL_RE.sub('?', _SPACE_RE.sub(' ', sql).strip())
+        if len(_shapes) < 1000:
+            _shapes[sql] = shape
+    return shape
+
+
+def is_full_scan(plan: list, shape: str = '') -> bool:
+    '''
+    True if any step of the plan reads a whole table without an index.
+    Scans bounded by the statement's LIMIT (no WHERE to filter the rows and
+    no temp b-tree to sort them) are not.
+    '''
+    if (
+        _LIMIT_RE.search(shape) and not _WHERE_RE.search(shape)
+        and not any('USE TEMP B-TREE' in detail for detail in plan)
+    ):
+        return False
+    for detail in plan:
+        if detail.startswith('SCAN ') and ' USING ' not in detail and 'CONSTANT ROW' not in detail:
+            return True
+    return False
+
+
+def _write(entry: dict):
+    entry = dict(time=f'{datetime.now():%Y-%m-%d %H:%M:%S}', **entry)
+    line = json.dumps(entry, default=str) + '\n'
+    with _log_lock:
+        try:
+            with open(defs.SLOW_QUERY_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            print(f'{defs.PACKAGE_NAME}: slow query log not written: {e}')
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> Optional[list]:
+    ''' EXPLAIN QUERY PLAN of a statement's shape, captured once per shape '''
+    shape = get_shape(sql)
+    if shape in _plans:
+        return _plans[shape]
+    if not shape.upper().startswith(_EXPLAINED):
+        _plans[shape] = None
+        return None
+    try:
+        rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        plan = [row[3] for row in rows]
+    except sqlite3.Error:
+        plan = None
+    _plans[shape] = plan
+    if plan and is_full_scan(plan, shape):
+        _write({'event': 'full_scan', 'db': conn.db_path, 'sql': shape, 'plan': plan})
+    return plan
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    '''
+    Cursor timing its statement from execute() until the rows are fetched.
+    The timing is checked against the threshold once the cursor is done:
+    after fetchall(), an exhausted fetch, the next execute() or close().
+    '''
+    _statement = None
+
+    def execute(self, sql: str, parameters=()):
+        self._finish()
+        plan = _explain(self.connection, sql, parameters)
+        start = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._statement = [sql, parameters, plan, time.perf_counter() - start, 0]
+        return result
+
+    def executemany(self, sql: str, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self._statement = [sql, '<executemany>', None, time.perf_counter() - start, 0]
+        return result
+
+    def _add(self, start: float, rows: int, done: bool):
+        if self._statement is not None:
+            self._statement[3] += time.perf_counter() - start
+            self._statement[4] += rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size: int = None):
+        start = time.perf_counter()
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._add(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(start, 0, True)
+            raise
+        self._add(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Single row queries (fetchone() once) are never exhausted
+        self._finish()
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        sql, parameters, plan, duration, rows = statement
+        if duration < _threshold:
+            return
+        if self.rowcount > 0:
+            rows = max(rows, self.rowcount)
+        _write({
+            'event': 'slow_query',
+            'db': self.connection.db_path,
+            'duration_ms': round(duration * 1000, 3),
+            'rows': rows,
+            'sql': get_shape(sql),
+            'parameters': parameters,
+            'plan': plan,
+        })
+
+
+class ProfiledConnection(sqlite3.Connection):
+    ''' sqlite3.connect(..., factory=ProfiledConnection) for the slow query log '''
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.db_path = str(database)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
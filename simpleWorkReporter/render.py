@@ -0,0 +1,78 @@
+'''
+simpleWorkReporter - render.py
+--
+Jinja2 template environment helpers shared by the web service and the
+command line scripts.  Compiled templates are stored in an on-disk bytecode
+cache so each new process skips re-compiling the templates from source.
+'''
+from . import defs
+from . import syslog
+from . import trace
+
+from jinja2 import (
+    Environment, FileSystemLoader, FileSystemBytecodeCache, Template, select_autoescape
+)
+from pathlib import Path
+from typing import Optional
+import os
+
+_environment = None
+
+
+def get_bytecode_cache(cache_dir: Path = None) -> Optional[FileSystemBytecodeCache]:
+    '''
+    Returns a bytecode cache stored in defs.JINJA_CACHE_DIR, or None if the
+    cache directory can't be created (templates then compile every run).
+    '''
+    cache_dir = cache_dir or defs.JINJA_CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        syslog.msg(f'Template bytecode cache disabled ({cache_dir}): {e}')
+        return None
+    return FileSystemBytecodeCache(str(cache_dir))
+
+
+def get_environment() -> Environment:
+    '''
+    Returns the standalone (non-flask) Jinja2 environment used outside of
+    the web service.  Autoescaping matches the flask environment.
+    '''
+    global _environment
+    if _environment is None:
+        _environment = Environment(
+            loader=FileSystemLoader(defs.TEMPLATE_DIR),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=get_bytecode_cache()
+        )
+        _environment.template_class = TracedTemplate
+    return _environment
+
+
+class TracedTemplate(Template):
+    '''
+    Template class recording each render as a trace span (see trace.py),
+    a flag check per render while tracing is off
+    '''
+    def render(self, *args, **kwargs) -> str:
+        with trace.span('render', template=self.name):
+            return super().render(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        span = trace.start('render', template=self.name, streamed=True)
+        try:
+            yield from super().generate(*args, **kwargs)
+        finally:
+            span.end()
+
+
+def warm_templates(env: Environment, names: list = None) -> int:
+    '''
+    Load (and compile if needed) the named templates, or every .html template
+    known to the environment's loader.  Returns the number of templates loaded.
+    '''
+    if names is None:
+        names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
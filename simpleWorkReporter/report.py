@@ -0,0 +1,305 @@
+'''
+simpleWorkReporter - report.py
+--
+Headless reporting core.  Renders and sends the work summary report using
+only the configuration, task database, mailer and jinja2 so scheduled sends
+(sendReport.py) don't need to import or construct the flask application.
+The web app uses the same routines with its own jinja environment.
+'''
+from . import defs
+from . import syslog
+from . import mailer
+from . import render
+from . import trace
+from .tasks import TaskDatabase, _get_date_range, _get_lease_owner
+
+from jinja2 import Environment
+from collections import Counter
+from typing import Tuple, Optional, BinaryIO
+from datetime import datetime
+import os
+import tempfile
+import zlib
+import socket
+import subprocess
+import time
+
+
+_hostname_cache = (None, 0.0) # (hostname, monotonic expiry)
+
+
+@trace.traced()
+def get_full_hostname(override: str = None) -> str:
+    '''
+    Returns the fully qualified hostname used in the report footer.
+    An override (worker.conf Service_Host) is returned as-is, otherwise the
+    looked up name is cached for defs.HOSTNAME_CACHE_TTL seconds.
+    '''
+    global _hostname_cache
+    if override:
+        return override
+    hostname, expires = _hostname_cache
+    if hostname and time.monotonic() < expires:
+        return hostname
+    hostname = _lookup_full_hostname()
+    _hostname_cache = (hostname, time.monotonic() + defs.HOSTNAME_CACHE_TTL)
+    syslog.dbg(f'Resolved service hostname: {hostname}')
+    return hostname
+
+
+def _lookup_full_hostname() -> str:
+    '''
+    Resolve the FQDN natively first and only fall back to spawning
+    'hostname -f' when the resolver can't supply a qualified name.
+    '''
+    hostname = socket.getfqdn()
+    if '.' in hostname and not hostname.startswith('localhost'):
+        return hostname
+    if os.name == 'posix':
+        try:
+            result = subprocess.run(
+                ['hostname','-f'], capture_output=True, text=True, timeout=5
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                return result.stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            pass
+    if os.name == 'nt':
+        hostname = socket.gethostname()
+        domain = os.getenv('USERDOMAIN')
+        if domain: hostname += f'.{domain}'
+        return hostname
+    # who knows... return something
+    return hostname or socket.gethostname()
+
+
+def render_report_to_file(
+    settings: dict, tasks: list, date_range: str,
+    service_host: str, env: Environment = None
+) -> BinaryIO:
+    '''
+    Render report.html through the template generator into a spooled
+    buffer (spills to disk past defs.REPORT_SPOOL_MEMORY) so the rendered
+    report is never held in memory as one string.  Returns the UTF-8 encoded
+    buffer positioned at the start.
+    '''
+    env = env or render.get_environment()
+    body = tempfile.SpooledTemporaryFile(max_size=defs.REPORT_SPOOL_MEMORY)
+    for chunk in env.get_template('report.html').generate(
+        settings=settings,
+        date_range=date_range,
+        tasks=tasks,
+        service_host=service_host
+    ):
+        body.write(chunk.encode('utf-8'))
+    body.seek(0)
+    return body
+
+
+def _sort_by_date(tasks: list) -> list:
+    return sorted(tasks, key=lambda t: (t['date'], t['id']))
+
+
+def _get_split_index(tasks: list) -> int:
+    ''' Split point nearest the middle, on a date boundary when there is one '''
+    middle = len(tasks) // 2
+    boundaries = [
+        i for i in range(1, len(tasks))
+        if tasks[i]['date'] != tasks[i - 1]['date']
+    ]
+    if not boundaries:
+        return middle
+    return min(boundaries, key=lambda i: abs(i - middle))
+
+
+def split_report_tasks(tasks: list, max_rows: int) -> list:
+    '''
+    Split tasks into date ordered parts of at most max_rows tasks, keeping
+    each date in one part unless that date alone exceeds the budget.
+    Returns a list of task lists (a single part if no split is needed).
+    '''
+    if not max_rows or len(tasks) <= max_rows:
+        return [tasks]
+    date_counts = Counter(t['date'] for t in tasks)
+    parts = []
+    current = []
+    for task in _sort_by_date(tasks):
+        if current and len(current) >= max_rows:
+            parts.append(current)
+            current = []
+        elif (
+            current and task['date'] != current[-1]['date']
+            and len(current) + date_counts[task['date']] > max_rows
+        ):
+            parts.append(current)
+            current = []
+        current.append(task)
+    if current:
+        parts.append(current)
+    return parts
+
+
+@trace.traced()
+def render_report_parts(
+    settings: dict, tasks: list, service_host: str, env: Environment = None
+) -> list:
+    '''
+    Render the report as one or more parts within the Report_Max_Rows and
+    Report_Max_Bytes budgets.  Parts over the byte budget are halved (on a
+    date boundary where possible) and re-rendered.
+    Returns a list of (tasks, date_range, body buffer) tuples.
+    '''
+    max_rows = _get_budget(settings, 'report_max_rows')
+    max_bytes = _get_budget(settings, 'report_max_bytes')
+    pending = split_report_tasks(tasks, max_rows)
+    parts = []
+    try:
+        while pending:
+            part_tasks = pending.pop(0)
+            date_range = _get_date_range(part_tasks)
+            body = render_report_to_file(settings, part_tasks, date_range, service_host, env)
+            size = body.seek(0, os.SEEK_END)
+            body.seek(0)
+            if max_bytes and size > max_bytes and len(part_tasks) > 1:
+                body.close()
+                part_tasks = _sort_by_date(part_tasks)
+                split = _get_split_index(part_tasks)
+                pending[0:0] = [part_tasks[:split], part_tasks[split:]]
+                continue
+            parts.append((part_tasks, date_range, body))
+    except BaseException:
+        for _tasks, _range, body in parts:
+            body.close()
+        raise
+    return parts
+
+
+def _get_budget(settings: dict, key: str) -> int:
+    ''' Integer budget setting, 0 (no limit) if unset or invalid '''
+    try:
+        return max(int(settings.get(key) or 0), 0)
+    except ValueError:
+        return 0
+
+
+@trace.traced()
+def send_report(
+    settings: dict, task_db: TaskDatabase, tasks: list = None,
+    service_host: str = None, env: Environment = None
+) -> Tuple[bool, Optional[str]]:
+    '''
+    Render and email the report for the supplied tasks (or all unsent tasks
+    if none are supplied), then mark those tasks as sent.  Large reports are
+    sent as multiple numbered emails, each part is marked as sent as soon as
+    it has been accepted so a failed send only retries the remaining parts.
+
+    Only one sender per task DB runs at a time (defs.SEND_LEASE_NAME lease).
+    A concurrent send fails fast, and supplied tasks that an earlier sender
+    has already sent are dropped rather than reported twice.
+
+    Returns tuple(result, message) where message is None or error details
+    '''
+    owner = _get_lease_owner()
+    result, holder = task_db.acquire_lease(
+        defs.SEND_LEASE_NAME, owner, defs.SEND_LEASE_SECONDS
+    )
+    if not result:
+        started = datetime.fromtimestamp(holder['acquired']).strftime('%H:%M:%S')
+        syslog.msg(f'Report send skipped, already in progress by {holder["owner"]}')
+        return False, f'Another report send is already in progress (started {started}).'
+    try:
+        return _send_report_parts(settings, task_db, tasks, service_host, env, owner)
+    finally:
+        task_db.release_lease(defs.SEND_LEASE_NAME, owner)
+
+
+def _send_report_parts(
+    settings: dict, task_db: TaskDatabase, tasks: Optional[list],
+    service_host: Optional[str], env: Optional[Environment], owner: str
+) -> Tuple[bool, Optional[str]]:
+    ''' send_report() body, run while holding the send lease '''
+    unsent = task_db.get_unsent_tasks()
+    if tasks is None:
+        tasks = unsent
+    else:
+        # Tasks may have been read before a previous sender finished
+        unsent_ids = {task['id'] for task in unsent}
+        tasks = [task for task in tasks if task['id'] in unsent_ids]
+    if not tasks:
+        return False, 'No unsent tasks available to report.'
+
+    service_host = service_host or get_full_hostname(settings.get('service_host'))
+    parts = render_report_parts(settings, tasks, service_host, env)
+    part_count = len(parts)
+    try:
+        for part, (part_tasks, date_range, body) in enumerate(parts, 1):
+            result, message = mailer.send_report_email(
+                settings, body, date_range, part=part, part_count=part_count
+            )
+            if not result:
+                if part_count > 1:
+                    message = f'Part {part} of {part_count} failed: {message}'
+                return False, message
+            task_db.set_tasks_as_sent(part_tasks)
+            task_db.add_report(
+                mailer._get_email_subject(settings, date_range, part, part_count),
+                ', '.join(mailer._get_send_to(settings)),
+                date_range, part_tasks, body, part, part_count
+            )
+            syslog.msg(
+                f'Report for {date_range} sent with {len(part_tasks)} tasks '
+                f'(part {part} of {part_count}).'
+            )
+            if part == part_count:
+                break
+            # Renew before the next part.  If the lease expired during a slow
+            # SMTP exchange another sender may own the remaining tasks now
+            result, holder = task_db.acquire_lease(
+                defs.SEND_LEASE_NAME, owner, defs.SEND_LEASE_SECONDS
+            )
+            if not result:
+                syslog.msg(
+                    f'Report send stopped after part {part} of {part_count}, '
+                    f'send lease taken over by {holder["owner"]}'
+                )
+                return False, (
+                    f'Report send stopped after part {part} of {part_count}: '
+                    f'another sender took over the remaining tasks.'
+                )
+    finally:
+        for _tasks, _range, body in parts:
+            body.close()
+    return True, None
+
+
+def open_report_body(compressed: bytes) -> BinaryIO:
+    ''' Decompress a stored report body into a spooled buffer at position 0 '''
+    body = tempfile.SpooledTemporaryFile(max_size=defs.REPORT_SPOOL_MEMORY)
+    decompressor = zlib.decompressobj()
+    view = memoryview(compressed)
+    for offset in range(0, len(view), 64 * 1024):
+        body.write(decompressor.decompress(view[offset:offset + 64 * 1024]))
+    body.write(decompressor.flush())
+    body.seek(0)
+    return body
+
+
+@trace.traced()
+def resend_report(
+    settings: dict, task_db: TaskDatabase, report_id: int
+) -> Tuple[bool, Optional[str]]:
+    '''
+    Re-send a stored report body to the currently configured recipients
+    without re-querying tasks or re-rendering the template.
+    '''
+    report = task_db.get_report(report_id)
+    if report is None:
+        return False, f'Report {report_id} does not exist.'
+    with open_report_body(report['body']) as body:
+        result, message = mailer.send_report_email(
+            settings, body, report['date_range'],
+            part=report['part'], part_count=report['part_count']
+        )
+    if result:
+        syslog.msg(f'Re-sent stored report {report_id} ({report["date_range"]}).')
+    return result, message
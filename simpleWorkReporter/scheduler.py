@@ -0,0 +1,273 @@
+'''
+simpleWorkReporter - scheduler.py
+--
+In-process job scheduler used by the web service to send reports on a
+cron-like schedule (worker.conf Report_Schedule) without cold-starting
+sendReport.py from the system scheduler.
+
+Each job keeps its last run time in a lock file under defs.SCHEDULE_STATE_DIR.
+The lock file is held (non-blocking) while a job is checked and run, so when
+several service instances share a data directory only one of them fires a
+given schedule.  Runs missed while the service was down are caught up once
+if they fall within the configured catch-up window.
+'''
+from . import defs
+from . import syslog
+from .errors import *
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class CronSchedule():
+    '''
+    Five field cron expression: minute hour day-of-month month day-of-week
+    Fields support '*', single values, ranges (1-5), lists (1,3,5) and
+    steps (*/15, 8-18/2).  Day-of-week uses 0-6 with 0 or 7 as Sunday.
+    '''
+    _FIELDS = (
+        ('minute', 0, 59),
+        ('hour', 0, 23),
+        ('day', 1, 31),
+        ('month', 1, 12),
+        ('weekday', 0, 7),
+    )
+
+    def __init__(self, expression: str):
+        self.expression = ' '.join(expression.split())
+        fields = self.expression.split(' ')
+        if len(fields) != len(self._FIELDS):
+            raise swrConfigError(
+                f'Invalid schedule "{expression}": expected 5 fields '
+                f'(minute hour day month weekday)'
+            )
+        parsed = {}
+        for text, (name, low, high) in zip(fields, self._FIELDS):
+            parsed[name] = _parse_cron_field(text, low, high, expression)
+        self.minutes = parsed['minute']
+        self.hours = parsed['hour']
+        self.days = parsed['day']
+        self.months = parsed['month']
+        # cron allows 7 for Sunday, python weekday() has Monday == 0
+        self.weekdays = {(d - 1) % 7 for d in parsed['weekday']}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def __repr__(self):
+        return f'CronSchedule({self.expression!r})'
+
+    def _day_matches(self, dt: datetime) -> bool:
+        ''' cron semantics: if both day fields are restricted, either may match '''
+        day_match = dt.day in self.days
+        weekday_match = dt.weekday() in self.weekdays
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return weekday_match
+        if self._any_weekday:
+            return day_match
+        return day_match or weekday_match
+
+    def next_after(self, dt: datetime) -> Optional[datetime]:
+        ''' Returns the first fire time strictly after dt (minute resolution) '''
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        return None
+
+    def last_fire_between(self, start: datetime, end: datetime) -> Optional[datetime]:
+        ''' Returns the latest fire time in the window (start, end], or None '''
+        last = None
+        fire = self.next_after(start)
+        while fire is not None and fire <= end:
+            last = fire
+            fire = self.next_after(fire)
+        return last
+
+
+def _parse_cron_field(text: str, low: int, high: int, expression: str) -> set:
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            if not step_text.isdigit() or int(step_text) < 1:
+                raise swrConfigError(f'Invalid step "{step_text}" in schedule "{expression}"')
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            if not (start_text.isdigit() and end_text.isdigit()):
+                raise swrConfigError(f'Invalid range "{part}" in schedule "{expression}"')
+            start, end = int(start_text), int(end_text)
+        elif part.isdigit():
+            start = int(part)
+            end = high if step > 1 else start
+        else:
+            raise swrConfigError(f'Invalid value "{part}" in schedule "{expression}"')
+        if start < low or end > high or start > end:
+            raise swrConfigError(
+                f'Value "{part}" out of range {low}-{high} in schedule "{expression}"'
+            )
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class ScheduledJob():
+    ''' A named action fired according to a CronSchedule '''
+    def __init__(self, name: str, schedule: CronSchedule, action: Callable[[], None]):
+        self.name = name
+        self.schedule = schedule
+        self.action = action
+
+    def __repr__(self):
+        return f'ScheduledJob(name={self.name!r}, schedule={self.schedule!r})'
+
+
+def get_job_name(prefix: str, expression: str) -> str:
+    ''' Stable, file-safe job name so each schedule keeps its own run state '''
+    digest = hashlib.sha1(' '.join(expression.split()).encode('utf-8')).hexdigest()
+    return f'{prefix}-{digest[:10]}'
+
+
+def parse_schedules(value: str) -> list:
+    ''' Split a ';' separated list of cron expressions into CronSchedules '''
+    return [CronSchedule(x) for x in (value or '').split(';') if x.strip()]
+
+
+class _JobLock():
+    '''
+    Non-blocking exclusive lock on a job's state file.  The file content is
+    the epoch time of the job's last run.
+    '''
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = None
+
+    def acquire(self) -> bool:
+        self._f = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._f.seek(0)
+                msvcrt.locking(self._f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._f.close()
+            self._f = None
+            return False
+        return True
+
+    def release(self):
+        if self._f is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        else:
+            self._f.seek(0)
+            msvcrt.locking(self._f.fileno(), msvcrt.LK_UNLCK, 1)
+        self._f.close()
+        self._f = None
+
+    def read_last_run(self) -> Optional[datetime]:
+        self._f.seek(0)
+        try:
+            return datetime.fromtimestamp(float(self._f.read().strip()))
+        except ValueError:
+            return None
+
+    def write_last_run(self, when: datetime):
+        self._f.seek(0)
+        self._f.truncate()
+        self._f.write(f'{when.timestamp()}\n')
+        self._f.flush()
+
+
+class Scheduler(threading.Thread):
+    '''
+    Background thread that wakes at each minute boundary and runs any due
+    jobs.  job_source is called on every tick so schedule changes in
+    worker.conf are picked up while the service runs.
+    '''
+    def __init__(self, job_source: Callable[[], list], catchup_hours: Callable[[], float],
+                 state_dir: Path = None):
+        super().__init__(name=f'{defs.PACKAGE_NAME}-scheduler', daemon=True)
+        self.job_source = job_source
+        self.catchup_hours = catchup_hours
+        self.state_dir = Path(state_dir or defs.SCHEDULE_STATE_DIR)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        syslog.msg(f'Scheduler started, state directory {self.state_dir}')
+        self.run_pending()
+        while not self._stop_event.wait(60 - (time.time() % 60) + 1):
+            self.run_pending()
+
+    def run_pending(self, now: datetime = None):
+        ''' Check every job and run the ones due since their last run '''
+        now = now or datetime.now()
+        try:
+            jobs = self.job_source()
+        except Exception as e:
+            syslog.msg(f'Scheduler unable to load jobs: {e}')
+            return
+        for job in jobs:
+            lock = _JobLock(self.state_dir / f'{job.name}.lock')
+            if not lock.acquire():
+                syslog.dbg(f'Scheduled job {job.name} is locked by another instance')
+                continue
+            try:
+                self._run_if_due(job, lock, now)
+            finally:
+                lock.release()
+
+    def _run_if_due(self, job: ScheduledJob, lock: _JobLock, now: datetime):
+        last_run = lock.read_last_run()
+        if last_run is None:
+            # First time this schedule is seen, start tracking from now
+            lock.write_last_run(now)
+            return
+        due = job.schedule.last_fire_between(last_run, now)
+        if due is None:
+            return
+        lock.write_last_run(now)
+        if now - due > timedelta(hours=self.catchup_hours()):
+            syslog.msg(
+                f'Skipping missed run of {job.name} ({job.schedule.expression}) '
+                f'due {due:%Y-%m-%d %H:%M}, outside the catch-up window'
+            )
+            return
+        syslog.msg(f'Running scheduled job {job.name} due {due:%Y-%m-%d %H:%M}')
+        try:
+            job.action()
+        except Exception as e:
+            syslog.msg(f'Scheduled job {job.name} failed: {type(e).__name__} - {e}')
@@ -4,27 +4,55 @@ simpleWorkReporter - sslcert.py
     the web server with SSL and managing, validating the cert files.
 
     This produces an x509 certificate equivalent to the openssl command:
-        openssl req -x509 -newkey rsa:4096 -nodes \
+        openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:P-256 -nodes \
             -out cert.pem -keyout key.pem \
             -days 2920
+    (or -newkey rsa:4096 / -newkey ed25519 depending on the key type)
+
+    The cryptography package is only imported when certificates are created
+    so the web service can build its SSLContext without loading it.
 '''
-from cryptography import x509
-from cryptography.x509.oid import NameOID
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from . import defs
+from .errors import *
+
 import datetime
 import os
 from pathlib import Path
-from ssl import SSLContext, PROTOCOL_TLS_SERVER
+from ssl import (
+    SSLContext, PROTOCOL_TLS_SERVER, TLSVersion,
+    OP_NO_COMPRESSION, OP_CIPHER_SERVER_PREFERENCE, OP_NO_TICKET
+)
 
 
-def create_ssl_files(cert_path: Path, key_path: Path):
-    # Generate private key
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=4096,
+def _generate_private_key(key_type: str):
+    ''' Generate a new private key of the requested type '''
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+    if key_type == 'ecdsa':
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == 'ed25519':
+        return ed25519.Ed25519PrivateKey.generate()
+    if key_type == 'rsa':
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=4096,
+        )
+    raise swrConfigError(
+        f'Unsupported SSL key type "{key_type}", expected one of: '
+        f'{", ".join(defs.SSL_KEY_TYPES)}'
     )
 
+
+def create_ssl_files(cert_path: Path, key_path: Path, key_type: str = None):
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+
+    # Generate private key
+    key_type = key_type or defs.SSL_KEY_TYPE
+    private_key = _generate_private_key(key_type)
+    # Ed25519 signatures embed their own hash
+    sign_hash = None if key_type == 'ed25519' else hashes.SHA256()
+
     # Create certificate
     subject = issuer = x509.Name([
         x509.NameAttribute(NameOID.COMMON_NAME, u"localhost"),
@@ -44,7 +72,7 @@ def create_ssl_files(cert_path: Path, key_path: Path):
             datetime.datetime.utcnow()
         ).not_valid_after(
             datetime.datetime.utcnow() + datetime.timedelta(days=2920)
-        ).sign(private_key, hashes.SHA256())
+        ).sign(private_key, sign_hash)
 
     # Write files
     with open(cert_path, "wb") as f:
@@ -58,6 +86,24 @@ def create_ssl_files(cert_path: Path, key_path: Path):
         ))
 
 
+def build_ssl_context(cert_path: Path, key_path: Path) -> SSLContext:
+    '''
+    Build the web server's SSLContext: TLS 1.2+, forward secret AEAD ciphers
+    only, and session resumption enabled through both session tickets and
+    OpenSSL's server side session cache so returning browsers skip the full
+    handshake.  Raises ssl.SSLError if the cert/key files are invalid.
+    '''
+    context = SSLContext(PROTOCOL_TLS_SERVER)
+    context.minimum_version = TLSVersion.TLSv1_2
+    context.set_ciphers(defs.SSL_CIPHERS)
+    context.options |= OP_NO_COMPRESSION | OP_CIPHER_SERVER_PREFERENCE
+    context.options &= ~OP_NO_TICKET
+    # TLS 1.3 tickets issued per handshake, one per parallel browser connection
+    context.num_tickets = 2
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
 def validate_ssl_files(cert_path: Path, key_path: Path) -> bool:
     '''
     Read the cert and key files to make sure they are good
@@ -86,4 +132,4 @@ def remove_ssl_files(cert_path: Path, key_path: Path):
     if os.path.isfile(cert_path):
         os.remove(cert_path)
     if os.path.isfile(key_path):
-        os.remove(key_path)
\ No newline at end of file
+        os.remove(key_path)
@@ -3,21 +3,40 @@ simpleWorkReporter / syslog.py
 --
 Definitions for handling application while console and file logging
 This wraps the python logging module around a class.  
+
+The log file is rotated once it reaches LOG_MAX_BYTES or at the start of
+each LOG_MAX_AGE second period, whichever comes first.  Rotated segments
+(swr_service.log.YYYYmmdd-HHMMSS) are gzip compressed by a background
+thread, so the request that triggers a rotation only pays for a rename,
+and all but the newest LOG_KEEP compressed segments are removed.
 '''
 import logging
+import gzip
 import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
 import types
 from pathlib import Path
 
 DEFAULT_APP_NAME = 'nb-syslog'
 DEFAULT_LOG_PATH = None
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_AGE = 86400
+DEFAULT_KEEP = 7
 
 # Attempt to load package level defaults for overrides
 try: from . import defs
 except ModuleNotFoundError: defs = None
 app_name = getattr(defs,'PACKAGE_NAME',DEFAULT_APP_NAME)
-log_file = getattr(defs,'DEFAULT_LOG_PATH',DEFAULT_LOG_PATH)
+log_file = getattr(defs,'LOG_FILE_PATH',DEFAULT_LOG_PATH)
 console_only = bool(getattr(defs,'LOG_CONSOLE_ONLY',False))
+max_bytes = getattr(defs,'LOG_MAX_BYTES',DEFAULT_MAX_BYTES)
+max_age = getattr(defs,'LOG_MAX_AGE',DEFAULT_MAX_AGE)
+keep = getattr(defs,'LOG_KEEP',DEFAULT_KEEP)
 DEBUG = getattr(defs, 'DEBUG', False)
 
 ''' Initialize the logger '''
@@ -40,7 +59,7 @@ _activated = False # Prevent adding file handler until 1st log event
 
 def msg(message: str, logger_action = 'msg') -> None:
     global syslog, _activated, log_file
-    if log_file is not None and not _activated:
+    if not _activated and log_file is not None and not console_only and not syslog.disabled:
         enable_file_logging()
         _activated = True
     if logger_action == 'msg': logger_func = syslog.info
@@ -51,16 +70,177 @@ def dbg(message: str) -> None:
     msg(message,'dbg')
 
 
+class _Compressor(threading.Thread):
+    '''
+    Background gzip of rotated log segments, followed by pruning the
+    oldest ones.  Segments are queued by _RotatingFileHandler.
+    '''
+    def __init__(self):
+        super().__init__(name=f'{app_name}-log-compressor', daemon=True)
+        self.segments = queue.Queue()
+
+    def run(self):
+        while True:
+            segment, keep_count = self.segments.get()
+            try:
+                if segment is not None:
+                    _compress_segment(segment)
+                _prune_segments(Path(log_file), keep_count)
+            except OSError as e:
+                # Logging about logging would recurse, report it on stderr
+                print(f'{app_name}: log segment {segment} not compressed: {e}', file=sys.stderr)
+
+
+def _compress_segment(segment: Path):
+    target = segment.with_name(segment.name + '.gz')
+    partial = segment.with_name(segment.name + '.gz.part')
+    with open(segment, 'rb') as src, gzip.open(partial, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partial, target)
+    segment.unlink()
+
+
+_STAMP_LENGTH = len('YYYYmmdd-HHMMSS')
+
+
+def _segment_key(path: Path, segment: Path) -> tuple:
+    '''
+    Sort key (stamp, suffix) of NAME.stamp[-suffix][.gz], so NAME.stamp
+    comes before NAME.stamp-1 and NAME.stamp-2 before NAME.stamp-10
+    '''
+    name = segment.name[len(path.name) + 1:]
+    if name.endswith('.gz'):
+        name = name[:-3]
+    stamp, suffix = name[:_STAMP_LENGTH], name[_STAMP_LENGTH + 1:]
+    return (stamp, int(suffix) if suffix.isdigit() else 0, suffix)
+
+
+def _get_segments(path: Path) -> list:
+    ''' Rotated segments of the log file at path, oldest first '''
+    return sorted(
+        (entry for entry in path.parent.glob(f'{path.name}.*')
+         if not entry.name.endswith('.part')),
+        key=lambda entry: _segment_key(path, entry)
+    )
+
+
+def _prune_segments(path: Path, keep_count: int):
+    '''
+    Remove all but the newest keep_count compressed segments.  Segments not
+    compressed yet are still queued for the compressor and are left alone.
+    '''
+    if keep_count <= 0:
+        return
+    compressed = [s for s in _get_segments(path) if s.name.endswith('.gz')]
+    for segment in compressed[:-keep_count]:
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _RotatingFileHandler(logging.FileHandler):
+    '''
+    FileHandler with size and time based rotation.  The time limit follows
+    fixed max_age periods, so a file last written in an earlier period is
+    rotated on the first record of the new one, even across restarts.
+    '''
+    def __init__(self, filename: Path):
+        super().__init__(filename, delay=False)
+        self.path = Path(self.baseFilename)
+        self._compressor = None
+        self._period = self._get_period(self._get_mtime())
+        # Segments left uncompressed by an earlier run
+        for segment in _get_segments(self.path):
+            if not segment.name.endswith('.gz'):
+                self._queue(segment)
+
+    def _get_mtime(self) -> float:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return time.time()
+
+    def _get_period(self, timestamp: float) -> int:
+        return int(timestamp // max_age) if max_age > 0 else 0
+
+    def _queue(self, segment: Path):
+        if self._compressor is None:
+            self._compressor = _Compressor()
+            self._compressor.start()
+        self._compressor.segments.put((segment, keep))
+
+    def _reopen_if_moved(self):
+        ''' Another process (the reloader parent) may have rotated the file '''
+        try:
+            moved = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            moved = True
+        if moved:
+            self.stream.close()
+            self.stream = self._open()
+
+    def should_rollover(self, record) -> bool:
+        if self.stream is None:
+            return False
+        self._reopen_if_moved()
+        if max_bytes > 0 and self.stream.tell() >= max_bytes:
+            return True
+        return self._get_period(time.time()) != self._period and self.stream.tell() > 0
+
+    def do_rollover(self):
+        self.stream.close()
+        self.stream = None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        segment = self.path.with_name(f'{self.path.name}.{stamp}')
+        # Number past the newest segment of this second, not the first free
+        # name - pruning frees the low numbers and they would sort as oldest
+        taken = [
+            _segment_key(self.path, entry)[1] for entry in _get_segments(self.path)
+            if _segment_key(self.path, entry)[0] == stamp
+        ]
+        if taken:
+            segment = self.path.with_name(f'{self.path.name}.{stamp}-{max(taken) + 1}')
+        try:
+            os.rename(self.baseFilename, segment)
+        except FileNotFoundError:
+            segment = None
+        self.stream = self._open()
+        self._period = self._get_period(time.time())
+        self._queue(segment)
+
+    def emit(self, record):
+        try:
+            if self.should_rollover(record):
+                self.do_rollover()
+        except OSError:
+            self.handleError(record)
+        super().emit(record)
+
+
 def enable_file_logging() -> bool:
     global syslog, log_file, _file_handler, _date_format, _syslog_formatter
     if not log_file:
         return False
-    _file_handler = logging.FileHandler(log_file)
+    _file_handler = _RotatingFileHandler(log_file)
     _file_handler.setLevel(logging.DEBUG)
     _file_handler.setFormatter(_syslog_formatter)
     syslog.addHandler(_file_handler)
     return True
 
+def set_rotation(max_size: int = None, max_seconds: int = None, keep_count: int = None):
+    '''
+    Override the defs rotation limits (e.g. from worker.conf).  0 disables
+    the size or age limit, or keeps every segment.
+    '''
+    global max_bytes, max_age, keep
+    if max_size is not None: max_bytes = max(int(max_size), 0)
+    if max_seconds is not None: max_age = max(int(max_seconds), 0)
+    if keep_count is not None: keep = max(int(keep_count), 0)
+    if _file_handler is not None:
+        _file_handler._period = _file_handler._get_period(_file_handler._get_mtime())
+
+
 def disable_file_logging():
     global syslog, _file_handler
     if _file_handler is not None:
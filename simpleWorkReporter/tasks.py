@@ -6,16 +6,34 @@ Task item management routines and classes
 
 from . import defs
 from . import syslog
+from . import trace
+from . import querylog
 from .errors import *
 from .devtools import vardump
 
 from pathlib import Path
 from enum import Enum, auto
-from typing import Tuple, Optional
-from datetime import datetime
+from typing import Tuple, Optional, BinaryIO
+from datetime import datetime, timedelta
 import time
 import os
+import socket
 import sqlite3
+import threading
+import zlib
+
+# Event wakeup conditions by resolved DB path, shared by every TaskDatabase
+# of the same file (team mode reloads evicted workers as new instances)
+_event_conditions = {}
+_event_conditions_lock = threading.Lock()
+
+def _get_event_condition(db_path: Path) -> threading.Condition:
+    key = str(Path(db_path).resolve())
+    with _event_conditions_lock:
+        condition = _event_conditions.get(key)
+        if condition is None:
+            condition = _event_conditions[key] = threading.Condition()
+        return condition
 
 class TaskDatabase():
     ''' 
@@ -23,12 +41,17 @@ class TaskDatabase():
     with the SimpleWorkReporter database.
     '''
 
-    def __init__(self, db_path: Path = None):
+    def __init__(self, db_path: Path = None, storage_profile: str = None):
         # Setup the Database values
         self.db_path = db_path or defs.TASKDB_FILE_PATH
+        self.set_storage_profile(storage_profile)
         try:
             self._table_name = defs.TASKDB_TASK_TABLE
             self._table_init_sql = defs.TASKDB_TABLESQL
+            self._report_table = defs.TASKDB_REPORT_TABLE
+            self._event_table = defs.TASKDB_EVENT_TABLE
+            self._lock_table = defs.TASKDB_LOCK_TABLE
+            self._schema_updates = defs.TASKDB_SCHEMA_UPDATES
         except AttributeError as e:
             missing = str(e).split("no attribute ")[1].replace("'","")
             raise swrDatabaseError(
@@ -38,6 +61,9 @@ class TaskDatabase():
         result, message = self._validate_db_path(self.db_path)
         if not result:
             raise swrDatabaseError(message)
+        self._update_schema()
+        # Wakes in-process event waiters as soon as a change is committed
+        self._event_condition = _get_event_condition(self.db_path)
         self._validated = True
     
     def __str__(self):
@@ -109,16 +135,63 @@ class TaskDatabase():
         syslog.dbg(f'Creating DB file {db_path} using TaskDatabase Schema')
         try:
             with sqlite3.connect(db_path) as conn:
+                # Lets maintenance return deleted task pages to the filesystem
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
                 conn.execute(self._table_init_sql)
                 conn.commit()
         except sqlite3.DatabaseError as e:
             error_msg = f'Unexpected error while creating task database: {str(e)}'
-            raise swrDatabaseError(error_message)
+            raise swrDatabaseError(error_msg)
         return True
 
 
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        New connection to the task DB with the storage profile applied.
+        The journal mode is persistent, so is only switched once.
+        '''
+        profile = self._storage_profile
+        conn = sqlite3.connect(
+            self.db_path, timeout=profile['busy_timeout'] / 1000,
+            factory=querylog.ProfiledConnection if querylog.is_enabled() else sqlite3.Connection
+        )
+        if not self._journal_mode_set:
+            try:
+                mode = conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}").fetchone()[0]
+                self._journal_mode_set = mode.upper() == profile['journal_mode'].upper()
+            except sqlite3.OperationalError as e:
+                # Needs a moment without other connections, try again next time
+                syslog.dbg(f'Unable to set journal mode of {self.db_path}: {e}')
+        conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+        conn.execute(f"PRAGMA temp_store = {profile['temp_store']}")
+        return conn
+
+    def _update_schema(self) -> None:
+        ''' Apply idempotent schema updates so older DB files gain new tables '''
+        try:
+            with self._connect() as conn:
+                for statement in self._schema_updates:
+                    conn.execute(statement)
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            raise swrDatabaseError(f'Unable to update task database schema: {e}')
+
+
     ## PUBLIC METHODS
 
+    def set_storage_profile(self, storage_profile: str = None):
+        '''
+        Use the named defs.TASKDB_STORAGE_PROFILES entry for new connections.
+        Raises swrConfigError for an unknown profile name.
+        '''
+        storage_profile = storage_profile or defs.OPTIONAL_CONF_VALUES['Storage_Profile']['default']
+        self._storage_profile = get_storage_profile(storage_profile)
+        self.storage_profile = storage_profile
+        self._journal_mode_set = False
+
+    @trace.traced()
     def add_task(self, 
         taskType: str,
         taskSubType: str,
@@ -130,22 +203,26 @@ class TaskDatabase():
         
         By default timestamp will use the current time.
         Returns tuple(result, message) indicating or fail as a bool, and
-            message is None or error_message if a failure
+            message is the new task id, or error_message if a failure
         '''
         timestamp = self._get_date_timestamp(date)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
+            with self._connect() as conn:
+                cursor = conn.execute(
                     f'INSERT INTO {self._table_name} '
                     '(taskType, taskSubType, description, timestamp, sent) '
                     'VALUES (?, ?, ?, ?, ?)',
                     (taskType, taskSubType, description, timestamp, float(0))
                 )
+                task_id = cursor.lastrowid
+                self._record_event(conn, 'add', [task_id])
                 conn.commit()
         except sqlite3.DatabaseError as e:
             return False, str(e)
-        return True, None
+        self._notify_event()
+        return True, task_id
 
+    @trace.traced()
     def edit_task(self,
         task_id: int,
         taskType: str,
@@ -163,32 +240,78 @@ class TaskDatabase():
             IMPL: Current intention is to not allow editing of sent tasks
                   but sent value may need to be mutable in the future.
             '''
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.execute(
                     f'UPDATE {self._table_name} SET '
                     f'taskType=?, taskSubtype=?, description=?, timestamp=?, sent=? WHERE id=?',
                     (taskType,taskSubType,description,timestamp, sent, task_id)
                 )
+                self._record_event(conn, 'edit', [task_id])
                 conn.commit()
         except sqlite3.DatabaseError as e:
             return False, str(e)
+        self._notify_event()
         return True, None
 
-    def get_tasks(self, unsent_only: bool = False, order_by: str = None) -> list:
+    def _get_filter_sql(self,
+        task_type: str = None,
+        task_subtype: str = None,
+        date_from: str = None,
+        date_to: str = None,
+        sent: bool = None
+    ) -> Tuple[str, list]:
         '''
-        Returns a list of all unsent task table enteries (dicts)
+        WHERE clause (or '') and parameters for the task list filters.
+        Dates are YYYY-MM-DD and inclusive, sent True/False picks sent or
+        unsent tasks.  Raises ValueError for a malformed date.
         '''
-        with sqlite3.connect(self.db_path) as conn:
+        clauses, params = [], []
+        if task_type:
+            clauses.append('taskType = ?')
+            params.append(task_type)
+        if task_subtype:
+            clauses.append('taskSubType = ?')
+            params.append(task_subtype)
+        if date_from:
+            clauses.append('timestamp >= ?')
+            params.append(datetime.strptime(date_from, '%Y-%m-%d').timestamp())
+        if date_to:
+            end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            clauses.append('timestamp < ?')
+            params.append(end.timestamp())
+        if sent is not None:
+            clauses.append('sent > 0' if sent else 'sent = 0')
+        where = f'WHERE {" AND ".join(clauses)} ' if clauses else ''
+        return where, params
+
+    @trace.traced()
+    def get_tasks(self,
+        unsent_only: bool = False,
+        order_by: str = None,
+        limit: int = None,
+        **filters
+    ) -> list:
+        '''
+        Returns a list of task table enteries (dicts), all unsent ones with
+        unsent_only, at most limit if given.  filters are the
+        _get_filter_sql() keywords: task_type, task_subtype, date_from,
+        date_to and sent.
+        '''
+        if unsent_only:
+            filters['sent'] = False
+        where, params = self._get_filter_sql(**filters)
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
-            exec_str = f'SELECT * FROM {self._table_name} '
-            if unsent_only: 
-                exec_str += 'WHERE sent = 0 '
+            exec_str = f'SELECT * FROM {self._table_name} {where}'
             if not order_by:
                 exec_str += 'ORDER BY id ASC'
             else:
                 exec_str += f'ORDER BY {order_by}'
+            if limit:
+                exec_str += ' LIMIT ?'
+                params.append(int(limit))
             
-            cursor = conn.execute(exec_str)
+            cursor = conn.execute(exec_str, params)
             results = [dict(row) for row in cursor.fetchall()]
             tasks = []
             for result in results:
@@ -202,13 +325,46 @@ class TaskDatabase():
             syslog.msg(f'Returning {len(tasks)} tasks.')
             return tasks
 
+    @trace.traced()
+    def get_task_facets(self, limit: int = None, **filters) -> dict:
+        '''
+        Task counts for the task list filters, as {'taskType': [(value,
+        count), ...], 'taskSubType': [...], 'sent': {'sent': n, 'unsent': n}}.
+        Each facet is counted with every filter except its own applied, so
+        its values are the choices the other filters leave.  Type and sub
+        type lists are the limit (default defs.TASK_FACET_LIMIT) most used.
+        '''
+        limit = limit or defs.TASK_FACET_LIMIT
+        facets = {}
+        with self._connect() as conn:
+            for column, own_filter in (('taskType', 'task_type'), ('taskSubType', 'task_subtype')):
+                where, params = self._get_filter_sql(
+                    **dict(filters, **{own_filter: None})
+                )
+                cursor = conn.execute(
+                    f'SELECT {column}, COUNT(*) AS tally FROM {self._table_name} {where}'
+                    f'GROUP BY {column} ORDER BY tally DESC, {column} LIMIT ?',
+                    params + [limit]
+                )
+                facets[column] = cursor.fetchall()
+            where, params = self._get_filter_sql(**dict(filters, sent=None))
+            cursor = conn.execute(
+                f'SELECT sent > 0, COUNT(*) FROM {self._table_name} {where}GROUP BY sent > 0',
+                params
+            )
+            counts = dict(cursor.fetchall())
+        facets['sent'] = {'sent': counts.get(1, 0), 'unsent': counts.get(0, 0)}
+        return facets
+
+    @trace.traced()
     def get_unsent_tasks(self) -> list:
         tasks = self.get_tasks(unsent_only=True)
         return tasks
     
+    @trace.traced()
     def get_unsent_tasks_count(self) -> int:
         ''' Basic call to get unsent task tally when we don't need the values '''
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.execute(
                 f"SELECT COUNT(id) from {self._table_name} WHERE sent = ?", 
                 (0,)
@@ -218,8 +374,9 @@ class TaskDatabase():
         return count
 
 
+    @trace.traced()
     def get_task(self, task_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute(f"SELECT * FROM {self._table_name} WHERE id = ?",(task_id,))
             results = [dict(row) for row in cursor.fetchall()]            
@@ -230,38 +387,239 @@ class TaskDatabase():
                 result['date'] = self._get_date(result['timestamp'])
                 return results[0]
 
+    @trace.traced()
     def delete_task(self, task_id: int) -> bool:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.execute(
                 f'DELETE from {self._table_name} WHERE id = ?',
                 (task_id,)
             )
-            conn.commit()
             rows_deleted = cursor.rowcount
+            if rows_deleted:
+                self._record_event(conn, 'delete', [task_id])
+            conn.commit()
 
             if not rows_deleted:
                 return False
             else:
+                self._notify_event()
                 return True
+    @trace.traced()
     def set_tasks_as_sent(self, tasks: list):
+        '''
+        Mark tasks as sent.  Tasks already marked sent (by a concurrent
+        sender) keep their original sent time and are skipped.
+        '''
         sent_time = time.time()
-        with sqlite3.connect(self.db_path) as conn:
+        updated = []
+        with self._connect() as conn:
             for task in tasks:
                 cursor = conn.execute(
-                    f'UPDATE {self._table_name} SET sent = ? WHERE id = ?',
+                    f'UPDATE {self._table_name} SET sent = ? WHERE id = ? AND sent = 0',
                     (sent_time, task["id"])
                 )
-                if not cursor.rowcount:
+                if cursor.rowcount:
+                    updated.append(task["id"])
+                    syslog.msg(
+                        f'Updated task ID {task["id"]} as sent {sent_time}'
+                    )
+                    continue
+                cursor = conn.execute(
+                    f'SELECT sent FROM {self._table_name} WHERE id = ?', (task["id"],)
+                )
+                if cursor.fetchone() is None:
                     raise swrDatabaseError(f'Unable to update task ID {task["id"]} as sent.')
-                conn.commit()
-                syslog.msg(
-                    f'Updated task ID {task["id"]} as sent {sent_time}'
+                syslog.msg(f'Task ID {task["id"]} was already marked as sent.')
+            if updated:
+                self._record_event(conn, 'sent', updated)
+            conn.commit()
+        if updated:
+            self._notify_event()
+
+    @trace.traced()
+    def acquire_lease(self, name: str, owner: str, duration: float) -> Tuple[bool, Optional[dict]]:
+        '''
+        Take (or renew, if already held by owner) the named lease for
+        duration seconds.  Expired leases are taken over.
+        Returns tuple(result, holder) where holder is the current lease row
+            when it is held by another owner
+        '''
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                # The first write takes the DB write lock, so the expiry check
+                # and the insert are atomic across processes
+                conn.execute(
+                    f'UPDATE {self._lock_table} SET expires = ? WHERE name = ? AND owner = ?',
+                    (now + duration, name, owner)
                 )
-            
+                conn.execute(
+                    f'DELETE FROM {self._lock_table} WHERE name = ? AND expires < ?',
+                    (name, now)
+                )
+                conn.execute(
+                    f'INSERT OR IGNORE INTO {self._lock_table} '
+                    f'(name, owner, acquired, expires) VALUES (?, ?, ?, ?)',
+                    (name, owner, now, now + duration)
+                )
+                holder = dict(conn.execute(
+                    f'SELECT * FROM {self._lock_table} WHERE name = ?', (name,)
+                ).fetchone())
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            raise swrDatabaseError(f'Unable to acquire lease "{name}": {e}')
+        if holder['owner'] != owner:
+            return False, holder
+        return True, None
+
+    @trace.traced()
+    def release_lease(self, name: str, owner: str) -> bool:
+        ''' Drop the named lease if owner still holds it '''
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f'DELETE FROM {self._lock_table} WHERE name = ? AND owner = ?',
+                (name, owner)
+            )
+            conn.commit()
+            return bool(cursor.rowcount)
+
+
+    def _record_event(self, conn: sqlite3.Connection, event: str, task_ids: list):
+        '''
+        Append a change event within the caller's transaction, pruning the
+        table back to defs.TASKDB_EVENT_RETENTION rows every so often.
+        '''
+        cursor = conn.execute(
+            f'INSERT INTO {self._event_table} (event, task_ids, timestamp) '
+            f'VALUES (?, ?, ?)',
+            (event, ','.join(str(x) for x in task_ids), time.time())
+        )
+        if cursor.lastrowid % 100 == 0:
+            conn.execute(
+                f'DELETE FROM {self._event_table} WHERE id <= ?',
+                (cursor.lastrowid - defs.TASKDB_EVENT_RETENTION,)
+            )
+
+    def _notify_event(self):
+        with self._event_condition:
+            self._event_condition.notify_all()
+
+    @trace.traced()
+    def get_change_counter(self) -> int:
+        ''' Id of the most recent change event, 0 if there are none '''
+        with self._connect() as conn:
+            cursor = conn.execute(f'SELECT MAX(id) FROM {self._event_table}')
+            return cursor.fetchone()[0] or 0
+
+    @trace.traced()
+    def get_events_since(self, event_id: int) -> list:
+        ''' Change events newer than event_id, oldest first '''
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                f'SELECT * FROM {self._event_table} WHERE id > ? ORDER BY id ASC',
+                (event_id,)
+            )
+            events = [dict(row) for row in cursor.fetchall()]
+        for event in events:
+            event['task_ids'] = [int(x) for x in event['task_ids'].split(',') if x]
+        return events
 
+    def wait_for_events(self, event_id: int, timeout: float) -> list:
+        '''
+        Block up to timeout seconds for change events newer than event_id.
+        Writes from this process wake the waiter immediately, writes from
+        other processes are seen when the timeout expires.
+        '''
+        events = self.get_events_since(event_id)
+        if events:
+            return events
+        with self._event_condition:
+            self._event_condition.wait(timeout)
+        return self.get_events_since(event_id)
+
+    @trace.traced()
+    def add_report(self,
+        subject: str,
+        recipients: str,
+        date_range: str,
+        tasks: list,
+        body: BinaryIO,
+        part: int = 1,
+        part_count: int = 1
+    ) -> int:
+        '''
+        Record a sent report in the history table.  body is the rendered
+        report file (UTF-8 HTML), which is zlib compressed in chunks as it is
+        read.  Returns the new report id.
+        '''
+        compressor = zlib.compressobj(9)
+        compressed = []
+        body_size = 0
+        body.seek(0)
+        while True:
+            chunk = body.read(64 * 1024)
+            if not chunk:
+                break
+            body_size += len(chunk)
+            compressed.append(compressor.compress(chunk))
+        compressed.append(compressor.flush())
+        task_ids = ','.join(str(task['id']) for task in tasks)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f'INSERT INTO {self._report_table} '
+                '(sent, subject, recipients, date_range, task_ids, task_count, '
+                'part, part_count, body_size, body) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (time.time(), subject, recipients, date_range, task_ids,
+                 len(tasks), part, part_count, body_size, b''.join(compressed))
+            )
+            conn.commit()
+            report_id = cursor.lastrowid
+        syslog.msg(f'Recorded report {report_id} ({body_size} bytes) in history.')
+        return report_id
+
+    @trace.traced()
+    def get_reports(self, limit: int = None) -> list:
+        '''
+        Returns report history metadata (no bodies), newest first, at most
+        limit if given
+        '''
+        exec_str = (
+            f'SELECT id, sent, subject, recipients, date_range, task_ids, '
+            f'task_count, part, part_count, body_size, length(body) AS stored_size '
+            f'FROM {self._report_table} ORDER BY id DESC'
+        )
+        params = []
+        if limit:
+            exec_str += ' LIMIT ?'
+            params.append(int(limit))
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(exec_str, params)
+            reports = [dict(row) for row in cursor.fetchall()]
+        for report in reports:
+            report['sentdate'] = self._get_datetime(report['sent'])
+        return reports
+
+    @trace.traced()
+    def get_report(self, report_id: int) -> Optional[dict]:
+        ''' Returns a single report's metadata and compressed body, or None '''
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                f'SELECT * FROM {self._report_table} WHERE id = ?', (report_id,)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        report = dict(row)
+        report['sentdate'] = self._get_datetime(report['sent'])
+        return report
 
     def debug_set_all_sent(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             sent_time = time.time()
             cursor = conn.execute(
                 f'UPDATE {self._table_name} SET sent = ? WHERE sent = 0',
@@ -276,7 +634,7 @@ class TaskDatabase():
     
 
     def debug_clear_sent_time(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             sent_time = 0
             cursor = conn.execute(
                 f'UPDATE {self._table_name} SET sent = ?',
@@ -289,6 +647,11 @@ class TaskDatabase():
 
 
 
+def _get_lease_owner() -> str:
+    ''' Identifies this process and thread in the lease table '''
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
 def _get_date_range(tasks: list) -> str:
     ''' 
     Quick format - Take a list of taskdb swr_task items and generate
@@ -301,3 +664,14 @@ def _get_date_range(tasks: list) -> str:
     date_range = f'{dates[0]}' if len(dates) > 0 else ''
     date_range += f' - {dates[-1]}' if len(dates) > 1 else ''
     return date_range
+
+
+def get_storage_profile(name: str) -> dict:
+    ''' Pragma values of a named storage profile, swrConfigError if unknown '''
+    profile = defs.TASKDB_STORAGE_PROFILES.get(str(name).strip().lower())
+    if profile is None:
+        raise swrConfigError(
+            f'Unknown Storage_Profile {name!r}, use one of: '
+            + ', '.join(defs.TASKDB_STORAGE_PROFILES)
+        )
+    return profile
@@ -0,0 +1,150 @@
+'''
+simpleWorkReporter - team.py
+--
+Team mode support.  One web service hosts many workers, each with their own
+directory under defs.TEAM_DIR holding a worker.conf and a tasks.db shard:
+
+    team/<worker_id>/worker.conf
+    team/<worker_id>/tasks.db
+
+Workers are opened on demand when they log in or make a request, and only
+the most recently used defs.TEAM_CACHE_SIZE are kept loaded, so memory use
+follows the number of active workers rather than registered ones.
+'''
+from . import defs
+from . import syslog
+from .config import LoadSwrSettings
+from .tasks import TaskDatabase
+from .errors import *
+
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+import os
+import re
+import threading
+
+_WORKER_ID_RE = re.compile(defs.TEAM_WORKER_ID_PATTERN)
+
+
+class WorkerContext():
+    ''' A team member's loaded settings and task database '''
+    def __init__(self, worker_id: str, worker_dir: Path):
+        self.worker_id = worker_id
+        self.worker_dir = worker_dir
+        self.settings = LoadSwrSettings(config_path=worker_dir / defs.CONFIG_FILE_NAME)
+        self.task_db = TaskDatabase(
+            db_path=worker_dir / defs.TASKDB_FILE_NAME,
+            storage_profile=self.settings.storage_profile
+        )
+
+    def __repr__(self):
+        return f'WorkerContext(worker_id={self.worker_id!r})'
+
+
+class WorkerRegistry():
+    '''
+    LRU of loaded WorkerContexts keyed by worker id.  get() loads a worker
+    on first use and evicts the least recently used one past capacity.
+    '''
+    def __init__(self, team_dir: Path = None, capacity: int = None):
+        self.team_dir = Path(team_dir or defs.TEAM_DIR)
+        self.capacity = capacity or defs.TEAM_CACHE_SIZE
+        self._workers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def get(self, worker_id: str) -> WorkerContext:
+        '''
+        Loaded context for worker_id.  Raises swrConfigError for unknown
+        workers or a worker with an invalid configuration.
+        '''
+        with self._lock:
+            worker = self._workers.get(worker_id)
+            if worker is not None:
+                self._workers.move_to_end(worker_id)
+                return worker
+        worker_dir = get_worker_dir(worker_id, self.team_dir)
+        if not (worker_dir / defs.CONFIG_FILE_NAME).is_file():
+            raise swrConfigError(f'Unknown team worker: {worker_id}')
+        # Load outside the lock, a slow disk shouldn't stall other workers
+        worker = WorkerContext(worker_id, worker_dir)
+        with self._lock:
+            worker = self._workers.setdefault(worker_id, worker)
+            self._workers.move_to_end(worker_id)
+            while len(self._workers) > self.capacity:
+                evicted, _ = self._workers.popitem(last=False)
+                syslog.dbg(f'Unloaded team worker {evicted}')
+        return worker
+
+    def find(self, worker_id: str) -> Optional[WorkerContext]:
+        ''' Like get(), but returns None for unknown or broken workers '''
+        try:
+            return self.get(worker_id)
+        except swrConfigError as e:
+            syslog.msg(f'Team worker {worker_id!r} unavailable: {e}')
+            return None
+
+    def loaded(self) -> list:
+        ''' Currently loaded WorkerContexts, least recently used first '''
+        with self._lock:
+            return list(self._workers.values())
+
+    def discard(self, worker_id: str):
+        with self._lock:
+            self._workers.pop(worker_id, None)
+
+
+def is_valid_worker_id(worker_id: str) -> bool:
+    return bool(worker_id) and _WORKER_ID_RE.fullmatch(worker_id) is not None
+
+
+def get_worker_dir(worker_id: str, team_dir: Path = None) -> Path:
+    ''' Directory holding a worker's config and task DB shard '''
+    if not is_valid_worker_id(worker_id):
+        raise swrConfigError(
+            f'Invalid worker id {worker_id!r} - use lowercase letters, '
+            f'digits, ".", "_" and "-"'
+        )
+    return Path(team_dir or defs.TEAM_DIR) / worker_id
+
+
+def list_workers(team_dir: Path = None) -> list:
+    ''' Ids of every registered team worker, sorted '''
+    team_dir = Path(team_dir or defs.TEAM_DIR)
+    if not team_dir.is_dir():
+        return []
+    return sorted(
+        entry.name for entry in team_dir.iterdir()
+        if is_valid_worker_id(entry.name) and (entry / defs.CONFIG_FILE_NAME).is_file()
+    )
+
+
+def get_team_secret_key(team_dir: Path = None) -> bytes:
+    '''
+    Session signing key shared by all team workers, created on first use.
+    Workers' own Access hashes can't be used as every worker has one.
+    '''
+    key_path = Path(team_dir or defs.TEAM_DIR) / defs.TEAM_SECRET_KEY_FILE
+    try:
+        with open(key_path, 'rb') as f:
+            key = f.read()
+        if len(key) >= 32:
+            return key
+    except FileNotFoundError:
+        pass
+    else:
+        raise swrConfigError(f'Team secret key file is damaged: {key_path}')
+    os.makedirs(key_path.parent, exist_ok=True)
+    key = os.urandom(32)
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process (the reloader parent/child) created it first
+        with open(key_path, 'rb') as f:
+            return f.read()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
@@ -0,0 +1,223 @@
+'''
+simpleWorkReporter - trace.py
+--
+Lightweight span tracing for finding where a slow request spends its time.
+Spans nest per thread and are appended to a local trace file as they end:
+
+    jsonl   one JSON object per span (defs.TRACE_FILE_PATH + .jsonl)
+    chrome  Chrome trace-event "X" events (+ .json), open the file in
+            chrome://tracing or https://ui.perfetto.dev
+
+Tracing is off unless enable() is called (startService.py / sendReport.py
+--trace), and span() / traced() cost one flag check while it is off.  The
+trace file is rotated at defs.TRACE_MAX_BYTES keeping defs.TRACE_KEEP old
+files.
+'''
+from . import defs
+
+from functools import wraps
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+TRACE_FORMATS = ('jsonl', 'chrome')
+
+_enabled = False
+_writer = None
+_local = threading.local()
+_span_ids = iter(range(1, 1 << 62))
+_span_ids_lock = threading.Lock()
+
+
+class Span():
+    ''' One timed operation.  end() records it, extra attributes via set() '''
+    __slots__ = ('name', 'span_id', 'parent_id', 'attrs', 'start', 'start_perf', '_ended')
+
+    def __init__(self, name: str, attrs: dict):
+        with _span_ids_lock:
+            self.span_id = next(_span_ids)
+        stack = _get_stack()
+        self.parent_id = stack[-1].span_id if stack else None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.start_perf = time.perf_counter()
+        self._ended = False
+        stack.append(self)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, error: BaseException = None):
+        if self._ended:
+            return
+        self._ended = True
+        duration = time.perf_counter() - self.start_perf
+        stack = _get_stack()
+        # Not always the innermost span - streamed template renders end late
+        if self in stack:
+            stack.remove(self)
+        if error is not None:
+            self.attrs['error'] = f'{type(error).__name__}: {error}'
+        if _writer is not None:
+            _writer.write(self, duration)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+
+class _NullSpan():
+    ''' Returned while tracing is off '''
+    def set(self, **attrs):
+        pass
+
+    def end(self, error: BaseException = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _TraceWriter():
+    ''' Appends finished spans to the trace file, rotating it by size '''
+    def __init__(self, path: Path, trace_format: str):
+        self.path = Path(path)
+        self.format = trace_format
+        self.pid = os.getpid()
+        self._file = None
+        # Re-entrant, a write error disables tracing which closes the writer
+        self._lock = threading.RLock()
+
+    def _open(self):
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self.format == 'chrome' and self._file.tell() == 0:
+            # The closing "]" is optional in the trace-event array format,
+            # which lets every process append to the same file
+            self._file.write('[\n')
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(defs.TRACE_KEEP - 1, 0, -1):
+            older = self.path.with_name(f'{self.path.name}.{index}')
+            if older.exists():
+                os.replace(older, self.path.with_name(f'{self.path.name}.{index + 1}'))
+        if defs.TRACE_KEEP > 0:
+            os.replace(self.path, self.path.with_name(f'{self.path.name}.1'))
+        else:
+            self.path.unlink()
+
+    def _format(self, span: Span, duration: float) -> str:
+        if self.format == 'chrome':
+            return json.dumps({
+                'name': span.name,
+                'ph': 'X',
+                'ts': round(span.start * 1e6),
+                'dur': round(duration * 1e6),
+                'pid': self.pid,
+                'tid': threading.get_ident(),
+                'args': dict(span.attrs, span_id=span.span_id, parent_id=span.parent_id),
+            }, default=str) + ',\n'
+        return json.dumps({
+            'name': span.name,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'start': round(span.start, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'pid': self.pid,
+            'thread': threading.current_thread().name,
+            'attrs': span.attrs,
+        }, default=str) + '\n'
+
+    def write(self, span: Span, duration: float):
+        line = self._format(span, duration)
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write(line)
+                self._file.flush()
+                if defs.TRACE_MAX_BYTES and self._file.tell() >= defs.TRACE_MAX_BYTES:
+                    self._rotate()
+            except OSError as e:
+                print(f'{defs.PACKAGE_NAME}: trace output disabled, {e}')
+                disable()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _get_stack() -> list:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def get_trace_path(trace_format: str) -> Path:
+    suffix = '.json' if trace_format == 'chrome' else '.jsonl'
+    return defs.TRACE_FILE_PATH.with_name(defs.TRACE_FILE_PATH.name + suffix)
+
+
+def enable(trace_format: str = 'jsonl', path: Path = None):
+    ''' Start writing spans to path (default get_trace_path(trace_format)) '''
+    global _enabled, _writer
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f'Unknown trace format {trace_format!r}, use one of: {", ".join(TRACE_FORMATS)}')
+    disable()
+    _writer = _TraceWriter(path or get_trace_path(trace_format), trace_format)
+    _enabled = True
+
+
+def disable():
+    global _enabled, _writer
+    _enabled = False
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def start(name: str, **attrs):
+    ''' Open a span, the caller must end() it.  Prefer span() where possible '''
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+def span(name: str, **attrs):
+    ''' Context manager timing the enclosed block as a span '''
+    return start(name, **attrs)
+
+
+def traced(name: str = None):
+    ''' Decorator recording each call of the function as a span '''
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,11 +1,33 @@
 #!/usr/bin/python3
-from simpleWorkReporter import SimpleWorkReporter
+'''
+startService.py
+
+Starts the simpleWorkReporter web service for the worker configured in
+worker.conf, or with --team one service for every worker set up with
+"setupService.py --worker <id>".
+'''
+import argparse
+
+from simpleWorkReporter import SimpleWorkReporter, defs, trace
 from simpleWorkReporter.errors import *
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--team', action='store_true',
+                        help=f'serve all team workers from {defs.TEAM_DIR}')
+    parser.add_argument('--port', type=int, default=defs.TEAM_SERVICE_PORT,
+                        help=f'team mode listen port (default {defs.TEAM_SERVICE_PORT})')
+    parser.add_argument('--trace', choices=trace.TRACE_FORMATS,
+                        help=f'record request spans to {defs.TRACE_FILE_PATH}.jsonl/.json')
+    args = parser.parse_args()
+    if args.trace:
+        trace.enable(args.trace)
     try:
-        app = SimpleWorkReporter()
+        if args.team:
+            app = SimpleWorkReporter(team_dir=defs.TEAM_DIR, team_port=args.port)
+        else:
+            app = SimpleWorkReporter()
         app.run()
     except swrConfigError as e:
         print(